@@ -0,0 +1,124 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.posts = [
+            Post.objects.create(
+                author=self.author, text=f'Пост {ind}', group=self.group
+            )
+            for ind in range(3)
+        ]
+        self.post = self.posts[-1]
+        Comment.objects.create(post=self.post, author=self.reader, text='К')
+
+    def get(self, name, params=None, **kwargs):
+        response = self.client.get(reverse(f'api:{name}', kwargs=kwargs),
+                                   params or {})
+        return response
+
+    def test_read_paths(self):
+        post = {'post_id': self.post.pk}
+        cases = (
+            ('feed', {}, lambda data: data['results'][0]['text'], 'Пост 2'),
+            ('post_detail', post, lambda data: data['author_name'],
+             'Лев Толстой'),
+            ('post_comments', post,
+             lambda data: data['results'][0]['author'], 'reader'),
+            ('group', {'slug': 'group'}, lambda data: data['posts_count'], 3),
+            ('group_posts', {'slug': 'group'},
+             lambda data: len(data['results']), 3),
+            ('profile', {'username': 'author'},
+             lambda data: data['posts_count'], 3),
+            ('profile_posts', {'username': 'author'},
+             lambda data: data['results'][0]['group'], 'group'),
+        )
+        for name, kwargs, extract, expected in cases:
+            with self.subTest(name=name):
+                response = self.get(name, **kwargs)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(extract(response.json()), expected)
+
+    def test_field_selection(self):
+        data = self.get('feed', {'fields': 'id,author'}).json()
+        self.assertEqual(data['results'][0],
+                         {'id': self.post.pk, 'author': 'author'})
+        response = self.get('feed', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('password', response.json()['detail'])
+
+    def test_cursor_pagination(self):
+        first = self.get('feed', {'limit': 2, 'fields': 'id'}).json()
+        self.assertEqual([item['id'] for item in first['results']],
+                         [self.posts[2].pk, self.posts[1].pk])
+        second = self.get(
+            'feed', {'limit': 2, 'fields': 'id', 'cursor': first['next']}
+        ).json()
+        self.assertEqual([item['id'] for item in second['results']],
+                         [self.posts[0].pk])
+        self.assertIsNone(second['next'])
+
+    def test_etag_and_server_cache(self):
+        url = reverse('api:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.post.text = 'Правка'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['text'], 'Правка')
+
+    def test_profile_counters_follow_subscriptions(self):
+        self.assertEqual(
+            self.get('profile', username='author').json()['followers_count'],
+            0
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            self.get('profile', username='author').json()['followers_count'],
+            1
+        )
+        self.assertEqual(
+            self.get('profile', username='reader').json()['following_count'],
+            1
+        )
+
+    def test_follow_feed(self):
+        self.assertEqual(self.get('follow_feed').status_code,
+                         HTTPStatus.UNAUTHORIZED)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.get('follow_feed').json()['results'], [])
+        Follow.objects.create(user=self.reader, author=self.author)
+        data = self.get('follow_feed', {'fields': 'id'}).json()
+        self.assertEqual(data['results'][0], {'id': self.post.pk})
+
+    def test_missing_objects(self):
+        for name, kwargs in (
+            ('post_detail', {'post_id': 999}),
+            ('post_comments', {'post_id': 999}),
+            ('group', {'slug': 'missing'}),
+            ('profile', {'username': 'missing'}),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name, **kwargs).status_code,
+                                 HTTPStatus.NOT_FOUND)
@@ -0,0 +1,110 @@
+"""Общие части JSON API: выбор полей, курсорные страницы, кэш и ETag.
+
+Ответы кэшируются целиком вместе с ETag под версиями областей
+posts.cache, так что повторный запрос и запрос с If-None-Match
+обслуживаются без обращений к базе.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.http import parse_etags
+
+from posts.cache import (SITE, cache_timeout, get_versions, make_key,
+                         replica_may_lag)
+from posts.utils import CNT_POSTS, CursorPaginator
+
+MAX_LIMIT = 50
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def error_response(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def selected_fields(request, fields):
+    """Поля из ?fields=a,b (по умолчанию все) с проверкой имён."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(fields)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ApiError(400, f'Неизвестные поля: {", ".join(unknown)}; '
+                            f'доступны: {", ".join(fields)}')
+    return names
+
+
+def serialize(obj, fields, names):
+    return {name: fields[name](obj) for name in names}
+
+
+def page_limit(request, default=CNT_POSTS):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise ApiError(400, 'limit должен быть числом')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def cursor_page(request, queryset, ordering, default_limit=CNT_POSTS):
+    paginator = CursorPaginator(
+        queryset, page_limit(request, default_limit), ordering
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def page_data(page, fields, names):
+    return {
+        'results': [serialize(obj, fields, names) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def etag_for(body):
+    return '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+
+
+def json_body(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':'))
+
+
+def respond(request, etag, body):
+    """Ответ с ETag; 304, если клиент прислал тот же ETag."""
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def cached_json(request, scopes, build, *key_parts):
+    """JSON ответа build() из кэша под версиями scopes и SITE.
+
+    Ключ учитывает путь и все параметры запроса (поля, курсор, limit).
+    Ошибки ApiError не кэшируются.
+    """
+    query = sorted(request.GET.items())
+    key = make_key(request.path, query, *key_parts,
+                   *get_versions(*scopes, SITE), prefix='api')
+    cached = cache.get(key)
+    if cached is None:
+        try:
+            body = json_body(build())
+        except ApiError as error:
+            return error_response(error.status, error.detail)
+        cached = (etag_for(body), body)
+        if not replica_may_lag(*scopes, SITE):
+            cache.set(key, cached, cache_timeout())
+    return respond(request, *cached)
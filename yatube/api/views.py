@@ -0,0 +1,155 @@
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from posts import feeds, queries
+from posts.cache import AUTHOR, FEED, FOLLOW, FOLLOWERS, GROUP, POST
+from posts.models import FeedEntry, Group, Post, User, UserStats
+from posts.thumbnails import resolve_thumbnails
+from posts.utils import CNT_COMMENTS
+
+from .utils import (ApiError, cached_json, cursor_page, error_response,
+                    page_data, selected_fields, serialize)
+
+# одинаково читаются с Post и FeedEntry; в лентах text — начало поста
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date,
+    'author': lambda post: post.author_username,
+    'author_name': lambda post: post.author_name,
+    'group': lambda post: post.group_slug or None,
+    'group_title': lambda post: post.group_title or None,
+    'image': lambda post: getattr(post, 'thumbnail_url', '') or None,
+    'image_pending': lambda post: post.image_pending,
+    'comments_count': lambda post: post.comments_count,
+}
+
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'post': lambda comment: comment.post_id,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created,
+}
+
+GROUP_FIELDS = {
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+    'posts_count': lambda group: group.posts_count,
+}
+
+PROFILE_FIELDS = {
+    'username': lambda user: user.username,
+    'full_name': lambda user: user.get_full_name(),
+    'posts_count': lambda user: UserStats.objects.for_user(user).posts_count,
+    'followers_count': (
+        lambda user: UserStats.objects.for_user(user).followers_count
+    ),
+    'following_count': (
+        lambda user: UserStats.objects.for_user(user).following_count
+    ),
+}
+
+
+def entries_page(request, queryset):
+    names = selected_fields(request, POST_FIELDS)
+    page = cursor_page(request, queryset, FeedEntry._meta.ordering)
+    return page_data(page, POST_FIELDS, names)
+
+
+@require_GET
+def feed(request):
+    return cached_json(
+        request, [FEED],
+        lambda: entries_page(request, FeedEntry.objects.all())
+    )
+
+
+@require_GET
+def group(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return cached_json(
+        request, [(GROUP, group.pk)],
+        lambda: serialize(
+            group, GROUP_FIELDS, selected_fields(request, GROUP_FIELDS)
+        )
+    )
+
+
+@require_GET
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return cached_json(
+        request, [(GROUP, group.pk)],
+        lambda: entries_page(request, group.feed_entries.all())
+    )
+
+
+@require_GET
+def profile(request, username):
+    user = get_object_or_404(queries.profile_author(), username=username)
+    return cached_json(
+        request, [(AUTHOR, user.pk), (FOLLOW, user.pk), (FOLLOWERS, user.pk)],
+        lambda: serialize(
+            user, PROFILE_FIELDS, selected_fields(request, PROFILE_FIELDS)
+        )
+    )
+
+
+@require_GET
+def profile_posts(request, username):
+    user = get_object_or_404(User, username=username)
+    return cached_json(
+        request, [(AUTHOR, user.pk)],
+        lambda: entries_page(request, user.feed_entries.all())
+    )
+
+
+@require_GET
+def post_detail(request, post_id):
+    def build():
+        names = selected_fields(request, POST_FIELDS)
+        post = queries.feed_posts().filter(pk=post_id).first()
+        if post is None:
+            raise ApiError(404, 'Пост не найден')
+        resolve_thumbnails([post])
+        return serialize(post, POST_FIELDS, names)
+
+    return cached_json(request, [(POST, post_id)], build)
+
+
+@require_GET
+def post_comments(request, post_id):
+    def build():
+        names = selected_fields(request, COMMENT_FIELDS)
+        page = cursor_page(
+            request,
+            queries.post_comments().filter(post_id=post_id),
+            ('created', 'id'),
+            CNT_COMMENTS
+        )
+        if not page and not Post.objects.filter(pk=post_id).exists():
+            raise ApiError(404, 'Пост не найден')
+        return page_data(page, COMMENT_FIELDS, names)
+
+    return cached_json(request, [(POST, post_id)], build)
+
+
+@require_GET
+def follow_feed(request):
+    user = request.user
+    if not user.is_authenticated:
+        return error_response(401, 'Нужна авторизация')
+
+    def build():
+        names = selected_fields(request, POST_FIELDS)
+        page = cursor_page(
+            request,
+            queries.feed_posts(feeds.follow_feed(user)),
+            feeds.FOLLOW_FEED_ORDERING
+        )
+        resolve_thumbnails(page)
+        return page_data(page, POST_FIELDS, names)
+
+    return cached_json(request, [FEED, (FOLLOW, user.pk)], build, user.pk)
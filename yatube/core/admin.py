@@ -0,0 +1,40 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'priority',
+        'attempts',
+        'run_at',
+        'locked_by',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    # аргументы могут быть личными данными: в админке их не видно,
+    # а очередь меняют только действия
+    exclude = ('payload',)
+    readonly_fields = (
+        'name',
+        'attempts',
+        'locked_at',
+        'locked_by',
+        'last_error',
+        'created',
+    )
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now()
+        )
+        self.message_user(request, f'Снова в очереди: {count}')
+    retry.short_description = 'Повторить выбранные задачи'
+
+
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,295 @@
+"""Нагрузочный прогон страниц сайта.
+
+Наполняет базу синтетическими данными, обходит все страницы
+posts.urls, users.urls, about.urls и api.urls тестовым клиентом в несколько
+потоков и считает перцентили задержки, число SQL-запросов на запрос
+и пропускную способность. Параллельно с чтением можно запустить
+писателей, которые комментируют и публикуют посты через те же view:
+так видно, сколько теряют читатели, пока идут записи. Результат —
+словарь, который команда benchmark выводит в JSON, чтобы сравнивать
+прогоны между коммитами.
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.urls import get_resolver, reverse
+
+from posts import images as post_images
+from posts.models import Comment, Follow, Group, Post
+from posts.transfer import rebuild_derived
+
+User = get_user_model()
+
+NAMESPACES = ('posts', 'users', 'about', 'api')
+# страницы, которые меняют состояние при GET или требуют одноразовый токен
+SKIP = {
+    'users:logout',
+    'users:password_reset_confirm',
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+    'posts:profile_export',
+}
+PERCENTILES = (50, 95, 99)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+WORDS = (
+    'лес', 'река', 'город', 'утро', 'кот', 'дорога', 'песня', 'дом',
+    'письмо', 'ветер', 'поезд', 'снег', 'книга', 'море', 'окно',
+)
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def seed(users=50, groups=5, posts=1000, comments=3000, follows=200,
+         images=20, random_seed=0, batch_size=500):
+    """Создаёт синтетические данные и производные от них таблицы.
+
+    Посты, комментарии и подписки пишутся bulk_create, поэтому
+    счётчики, ленты подписок и поисковый индекс затем
+    пересчитываются целиком. Возвращает образцы объектов для адресов.
+    """
+    rnd = random.Random(random_seed)
+    password = make_password('benchmark')
+    User.objects.bulk_create(
+        [User(username=f'user{ind}', password=password,
+              first_name=f'Имя{ind}', last_name=f'Фамилия{ind}')
+         for ind in range(max(users, 1))],
+        batch_size=batch_size
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    Group.objects.bulk_create(
+        [Group(title=f'Группа {ind}', slug=f'group-{ind}',
+               description=_text(rnd, 12))
+         for ind in range(max(groups, 1))],
+        batch_size=batch_size
+    )
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    Post.objects.bulk_create(
+        [Post(text=_text(rnd, rnd.randint(5, 60)),
+              author_id=rnd.choice(user_ids),
+              group_id=rnd.choice(group_ids + [None]))
+         for _ in range(max(posts, 1))],
+        batch_size=batch_size,
+        sync_entries=False
+    )
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    Comment.objects.bulk_create(
+        [Comment(text=_text(rnd, rnd.randint(3, 20)),
+                 author_id=rnd.choice(user_ids),
+                 post_id=rnd.choice(post_ids))
+         for _ in range(comments)],
+        batch_size=batch_size
+    )
+    pairs = {
+        tuple(rnd.sample(user_ids, 2))
+        for _ in range(follows) if len(user_ids) > 1
+    }
+    Follow.objects.bulk_create(
+        [Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in pairs],
+        batch_size=batch_size
+    )
+    for post_id in rnd.sample(post_ids, min(images, len(post_ids))):
+        post = Post.objects.get(pk=post_id)
+        post.image = SimpleUploadedFile(
+            f'bench_{post_id}.gif', SMALL_GIF, content_type='image/gif'
+        )
+        post.save(update_fields=['image'])
+        post_images.process_image(post_id)
+    rebuild_derived()
+    reader = User.objects.get(
+        pk=Follow.objects.values_list('user_id', flat=True).first()
+        or user_ids[0]
+    )
+    post = Post.objects.filter(comments__isnull=False).first()
+    return {
+        'reader': reader,
+        'post': post or Post.objects.first(),
+        'author': (post or Post.objects.first()).author,
+        'group': Group.objects.first(),
+    }
+
+
+def target_urls(sample):
+    """Адреса всех GET-страниц приложений из NAMESPACES."""
+    values = {
+        'slug': sample['group'].slug,
+        'username': sample['author'].username,
+        'post_id': sample['post'].pk,
+    }
+    query = {'posts:search': '?q=' + WORDS[0]}
+    resolver = get_resolver()
+    urls = []
+    for namespace in NAMESPACES:
+        _, app_resolver = resolver.namespace_dict[namespace]
+        for pattern in app_resolver.url_patterns:
+            name = f'{namespace}:{pattern.name}'
+            if pattern.name is None or name in SKIP:
+                continue
+            kwargs = {
+                key: values[key] for key in pattern.pattern.regex.groupindex
+            }
+            urls.append((name, reverse(name, kwargs=kwargs) + query.get(
+                name, ''
+            )))
+    return urls
+
+
+class QueryCounter:
+    """Считает SQL-запросы соединения текущего потока."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples, elapsed=None):
+    """Сводка по замерам [(секунды, запросы, статус), …]."""
+    timings = [seconds * 1000 for seconds, _, _ in samples]
+    summary = {'requests': len(samples)}
+    for percent in PERCENTILES:
+        value = percentile(timings, percent)
+        summary[f'p{percent}_ms'] = value and round(value, 3)
+    summary['mean_ms'] = (
+        round(sum(timings) / len(timings), 3) if timings else None
+    )
+    summary['queries_per_request'] = (
+        round(sum(queries for _, queries, _ in samples) / len(samples), 2)
+        if samples else None
+    )
+    summary['errors'] = sum(1 for _, _, status in samples if status >= 500)
+    if elapsed:
+        summary['requests_per_second'] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+def login_cookie(user):
+    """Сессия user один раз: параллельные логины дрались бы за таблицу
+    сессий."""
+    login = Client()
+    login.force_login(user)
+    return login.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def measured(client, method, *args, **kwargs):
+    """(секунды, запросы, статус) одного запроса клиента."""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        response = getattr(client, method)(*args, **kwargs)
+        seconds = time.perf_counter() - started
+    close_old_connections()
+    return seconds, counter.count, response.status_code
+
+
+def write_loop(session, post_ids, stop, samples, random_seed):
+    """Пишет до stop: комментарии и каждый пятый раз новый пост."""
+    rnd = random.Random(random_seed)
+    client = Client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session
+    writes = 0
+    while not stop.is_set():
+        writes += 1
+        if writes % 5:
+            url = reverse('posts:add_comment',
+                          kwargs={'post_id': rnd.choice(post_ids)})
+        else:
+            url = reverse('posts:post_create')
+        samples.append(
+            measured(client, 'post', url, {'text': _text(rnd, 10)})
+        )
+    connection.close()
+
+
+def run(urls, user=None, workers=4, rounds=10, warmup=1, writers=0,
+        writer=None, post_ids=()):
+    """Обходит urls rounds раз в workers потоков; возвращает сводку.
+
+    writers потоков тем временем пишут от имени writer в посты post_ids.
+    """
+    local = threading.local()
+    session = None if user is None else login_cookie(user)
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            if session is not None:
+                local.client.cookies[settings.SESSION_COOKIE_NAME] = session
+        return local.client
+
+    def fetch(item):
+        name, url = item
+        return name, measured(client(), 'get', url)
+
+    for _ in range(warmup):
+        for item in urls:
+            fetch(item)
+    jobs = list(urls) * rounds
+    random.Random(0).shuffle(jobs)
+    by_url = defaultdict(list)
+    write_samples = []
+    stop = threading.Event()
+    write_threads = []
+    if writers:
+        write_session = login_cookie(writer)
+        write_threads = [
+            threading.Thread(
+                target=write_loop, name=f'bench-writer-{ind}',
+                args=(write_session, list(post_ids), stop, write_samples,
+                      ind)
+            )
+            for ind in range(writers)
+        ]
+    started = time.perf_counter()
+    for thread in write_threads:
+        thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for name, sample in pool.map(fetch, jobs):
+                by_url[name].append(sample)
+    finally:
+        stop.set()
+        for thread in write_threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    report = {
+        'total': summarize(
+            [sample for samples in by_url.values() for sample in samples],
+            elapsed
+        ),
+        'urls': {
+            name: summarize(by_url[name]) for name, _ in urls
+        },
+    }
+    if writers:
+        report['writes'] = summarize(write_samples, elapsed)
+    return report
@@ -0,0 +1,32 @@
+"""Бэкенды кэша, которые сообщают о попаданиях и промахах в метрики."""
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+
+from . import metrics
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания и промахи get() и get_many() текущего запроса."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            hit = value is not _MISSING
+            request_metrics.cache_lookup(int(hit), int(not hit))
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        request_metrics = metrics.current()
+        if request_metrics is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        with request_metrics.cache_batch():
+            found = super().get_many(keys, version)
+        request_metrics.cache_lookup(len(found), len(keys) - len(found))
+        return found
+
+
+class LocMemCache(InstrumentedCacheMixin, BaseLocMemCache):
+    pass
@@ -0,0 +1,55 @@
+"""Повтор записей, которым не хватило ожидания блокировки SQLite.
+
+Писатели SQLite идут по одному: остальные ждут по busy_timeout (см.
+core.db_backends.sqlite3). Если блокировку не удалось получить и за
+это время, retry_on_locked повторяет всю транзакцию с растущей паузой.
+Повторять можно только снаружи transaction.atomic: внутри чужой
+транзакции ошибка пробрасывается дальше.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_locked_error(error):
+    return any(message in str(error) for message in LOCKED_MESSAGES)
+
+
+def retry_on_locked(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Декоратор: повторяет func при «database is locked».
+
+    Число попыток и начальная пауза — DB_LOCK_RETRIES и
+    DB_LOCK_RETRY_DELAY; пауза удваивается и немного случайна, чтобы
+    повторы писателей не совпадали.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            retries = getattr(settings, 'DB_LOCK_RETRIES', 3)
+            delay = getattr(settings, 'DB_LOCK_RETRY_DELAY', 0.05)
+            for attempt in range(retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as error:
+                    if (attempt == retries or not is_locked_error(error)
+                            or connections[using].in_atomic_block):
+                        raise
+                    pause = delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                    logger.warning(
+                        'База занята в %s, повтор %s через %.3f с',
+                        func.__qualname__, attempt + 1, pause
+                    )
+                    time.sleep(pause)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -0,0 +1,83 @@
+"""SQLite, настроенный для одновременных читателей и писателей.
+
+Каждое новое соединение получает PRAGMA из OPTIONS['pragmas'] (поверх
+PRAGMAS): журнал WAL, в котором читатели не ждут писателя, synchronous
+NORMAL, увеличенный кэш страниц, mmap и busy_timeout, с которым
+писатель ждёт освобождения базы, а не падает сразу.
+
+Транзакции начинаются с BEGIN {OPTIONS['transaction_mode']} (по
+умолчанию IMMEDIATE): писатель берёт блокировку в начале транзакции
+и ждёт её по busy_timeout. С обычным BEGIN транзакция, которая сначала
+читает, а потом пишет, получает «database is locked» без ожидания.
+
+Постоянные соединения (CONN_MAX_AGE) проверяются перед первым
+использованием в запросе, если в настройках базы CONN_HEALTH_CHECKS.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # отрицательное значение — в килобайтах
+    'cache_size': -64000,
+    'mmap_size': 128 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = {'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def pragmas(self):
+        options = self.settings_dict['OPTIONS']
+        return {**PRAGMAS, **options.get('pragmas', {})}
+
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get(
+            'transaction_mode', 'IMMEDIATE'
+        ).upper()
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f'Неизвестный transaction_mode: {mode}')
+        return mode
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas().items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode()}')
+
+    def is_usable(self):
+        try:
+            self.connection.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # вызывается в начале и конце каждого запроса: следующий запрос
+        # проверит соединение, которое осталось открытым
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import (override_settings, setup_databases,
+                               teardown_databases)
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Наполняет тестовую базу синтетическими данными и замеряет '
+            'страницы сайта; результат выводится в JSON')
+
+    def add_arguments(self, parser):
+        for name, default in (
+            ('users', 50), ('groups', 5), ('posts', 1000),
+            ('comments', 3000), ('follows', 200), ('images', 20),
+        ):
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Сколько создать ({default} по умолчанию)'
+            )
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Число параллельных клиентов')
+        parser.add_argument('--rounds', type=int, default=10,
+                            help='Сколько раз запросить каждую страницу')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Обходов для прогрева кэшей до замеров')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Писателей в последнем прогоне, который '
+                                 'читает под записью (0 — без него)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON вместо stdout')
+
+    def handle(self, *args, **options):
+        dataset = {
+            name: options[name] for name in (
+                'users', 'groups', 'posts', 'comments', 'follows', 'images'
+            )
+        }
+        with tempfile.TemporaryDirectory() as workdir:
+            report = self.measure(workdir, dataset, options)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure(self, workdir, dataset, options):
+        # SQLite в памяти с общим кэшем блокирует таблицы между потоками,
+        # поэтому тестовая база — файл во временном каталоге
+        for alias in connections:
+            if connections[alias].vendor == 'sqlite':
+                connections[alias].settings_dict['TEST']['NAME'] = (
+                    os.path.join(workdir, f'{alias}.sqlite3')
+                )
+        # замеры идут на отдельной тестовой базе и без DEBUG:
+        # рабочие данные не меняются, debug_toolbar не искажает время
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(
+                DEBUG=False, MEDIA_ROOT=os.path.join(workdir, 'media'),
+                POSTS_IMAGE_EAGER=True
+            ):
+                cache.clear()
+                sample = benchmark.seed(random_seed=options['seed'],
+                                        **dataset)
+                urls = benchmark.target_urls(sample)
+                run = {
+                    'workers': options['workers'],
+                    'rounds': options['rounds'],
+                    'warmup': options['warmup'],
+                }
+                report = {
+                    'dataset': dataset,
+                    'run': {**run, 'writers': options['writers']},
+                }
+                for label, user in (('anonymous', None),
+                                    ('authenticated', sample['reader'])):
+                    cache.clear()
+                    report[label] = benchmark.run(urls, user=user, **run)
+                if options['writers']:
+                    # последним: писатели меняют данные
+                    cache.clear()
+                    report['under_writes'] = benchmark.run(
+                        urls, user=sample['reader'],
+                        writers=options['writers'], writer=sample['author'],
+                        post_ids=[sample['post'].pk], **run
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        return report
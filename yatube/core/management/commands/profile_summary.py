@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = 'Показывает самые горячие кадры из стеков профайлера по view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Каталог со стеками '
+                                          '(по умолчанию PROFILING_DIR)')
+        parser.add_argument('--view', help='Только этот view, '
+                                           'например posts:profile')
+        parser.add_argument('--limit', type=int, default=15)
+        parser.add_argument(
+            '--token',
+            action='store_true',
+            help='Вывести значение заголовка X-Profile и выйти'
+        )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(profiling.make_token())
+            return
+        directory = options['dir'] or profiling.profiling_dir()
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет каталога {directory}')
+        names = sorted(
+            name for name in os.listdir(directory)
+            if name.endswith(profiling.SUFFIX)
+        )
+        if options['view']:
+            wanted = os.path.basename(profiling.stacks_path(options['view']))
+            names = [name for name in names if name == wanted]
+        if not names:
+            self.stdout.write('Стеков нет')
+            return
+        for name in names:
+            stacks = profiling.load_stacks(os.path.join(directory, name))
+            samples = sum(stacks.values())
+            if not samples:
+                continue
+            own, total = profiling.hottest_frames(stacks, options['limit'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name[:-len(profiling.SUFFIX)]}: {samples} семплов'
+            ))
+            for title, frames in (('Собственное время', own),
+                                  ('Включая вызовы', total)):
+                self.stdout.write(f'  {title}:')
+                for frame, count in frames:
+                    self.stdout.write(
+                        f'    {count / samples:6.1%}  {count:6}  {frame}'
+                    )
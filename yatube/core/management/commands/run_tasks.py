@@ -0,0 +1,53 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core import tasks
+from core.models import Task
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди (core.Task) '
+            'в несколько потоков')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Сколько задач выполнять одновременно'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и выйти'
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if not options['once']:
+            # текущие задачи доделываются, новые не берутся
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            self.stdout.write(
+                f'Воркеров: {options["concurrency"]}, остановка — Ctrl+C'
+            )
+        tasks.run_workers(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+            drain=options['once'],
+            stop=stop,
+        )
+        left = Task.objects.values('status').annotate(
+            count=Count('id')
+        ).order_by('status')
+        for row in left:
+            self.stdout.write(f'{row["status"]}: {row["count"]}')
@@ -0,0 +1,276 @@
+"""Метрики запросов для постоянной работы в продакшене.
+
+MetricsMiddleware замеряет каждый запрос: общее время, число и время
+SQL-запросов, попадания и промахи кэша, время рендеринга шаблонов и
+размер ответа. Замеры складываются в гистограммы по имени view и
+отдаются в текстовом формате Prometheus на /metrics/ (по токену
+METRICS_TOKEN или персоналу). Окна и скорости считает Prometheus по
+накопительным счётчикам; данные живут в памяти процесса, поэтому
+каждый воркер отдаёт свои.
+
+Кэш и шаблоны сообщают о себе через current(): его вызывают
+core.cache_backends и core.template_backends, вне запроса он None.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+_state = threading.local()
+
+
+def current():
+    """Замеры текущего запроса или None вне запроса."""
+    return getattr(_state, 'metrics', None)
+
+
+def slow_request_seconds():
+    return getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', 1.0)
+
+
+def sql_limit():
+    return getattr(settings, 'METRICS_SQL_LIMIT', 50)
+
+
+class RequestMetrics:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.statements = []
+        self._template_depth = 0
+        self._cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            if len(self.statements) < sql_limit():
+                self.statements.append((duration, sql))
+
+    def cache_lookup(self, hits, misses):
+        if not self._cache_depth:
+            self.cache_hits += hits
+            self.cache_misses += misses
+
+    @contextmanager
+    def cache_batch(self):
+        """Внутренние get() пакетного чтения не считаются отдельно."""
+        self._cache_depth += 1
+        try:
+            yield
+        finally:
+            self._cache_depth -= 1
+
+    @contextmanager
+    def template(self):
+        """Время рендеринга; вложенные шаблоны входят во внешний."""
+        self._template_depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._template_depth -= 1
+            if not self._template_depth:
+                self.template_time += time.perf_counter() - started
+
+
+class Histogram:
+    """Накопительная гистограмма Prometheus с метками."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0, 0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            label_text = format_labels(labels)
+            for bound, bucket in zip(self.buckets, counts):
+                yield (f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                       f'{bucket}')
+            yield f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}'
+            yield f'{self.name}_sum{{{label_text}}} {total}'
+            yield f'{self.name}_count{{{label_text}}} {count}'
+
+
+class Counter:
+    """Счётчик Prometheus с метками."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{{{format_labels(labels)}}} {value}'
+
+
+def format_labels(labels):
+    def escape(value):
+        return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n'))
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class Registry:
+    """Все метрики процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram(
+            'yatube_request_duration_seconds',
+            'Время обработки запроса', DURATION_BUCKETS
+        )
+        self.db_queries = Histogram(
+            'yatube_db_queries', 'SQL-запросов на запрос', QUERY_BUCKETS
+        )
+        self.db_duration = Histogram(
+            'yatube_db_duration_seconds',
+            'Время SQL-запросов на запрос', DURATION_BUCKETS
+        )
+        self.template_duration = Histogram(
+            'yatube_template_duration_seconds',
+            'Время рендеринга шаблонов на запрос', DURATION_BUCKETS
+        )
+        self.response_size = Histogram(
+            'yatube_response_size_bytes', 'Размер ответа', SIZE_BUCKETS
+        )
+        self.cache = Counter(
+            'yatube_cache_requests_total', 'Обращения к кэшу на чтение'
+        )
+
+    def record(self, view, status, seconds, request_metrics, size):
+        labels = (('view', view),)
+        with self.lock:
+            self.duration.observe(labels + (('status', status),), seconds)
+            self.db_queries.observe(labels, request_metrics.queries)
+            self.db_duration.observe(labels, request_metrics.db_time)
+            self.template_duration.observe(
+                labels, request_metrics.template_time
+            )
+            if size is not None:
+                self.response_size.observe(labels, size)
+            self.cache.inc(labels + (('result', 'hit'),),
+                           request_metrics.cache_hits)
+            self.cache.inc(labels + (('result', 'miss'),),
+                           request_metrics.cache_misses)
+
+    def metrics(self):
+        return (self.duration, self.db_queries, self.db_duration,
+                self.template_duration, self.response_size, self.cache)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        with self.lock:
+            lines = [
+                line for metric in self.metrics() for line in metric.lines()
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.__init__()
+
+
+registry = Registry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Замеряет запрос и пишет медленные в лог вместе с их SQL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = _state.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with self.wrap_connections(request_metrics):
+                response = self.get_response(request)
+        finally:
+            _state.metrics = None
+        seconds = time.perf_counter() - started
+        view = view_name(request)
+        registry.record(view, response.status_code, seconds,
+                        request_metrics, response_size(response))
+        if seconds >= slow_request_seconds():
+            self.log_slow(request, view, seconds, request_metrics)
+        return response
+
+    @contextmanager
+    def wrap_connections(self, request_metrics):
+        wrapped = []
+        try:
+            for connection in connections.all():
+                connection.execute_wrappers.append(request_metrics)
+                wrapped.append(connection)
+            yield
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(request_metrics)
+
+    def log_slow(self, request, view, seconds, request_metrics):
+        statements = '\n'.join(
+            f'  {duration * 1000:.1f} мс  {sql}'
+            for duration, sql in request_metrics.statements
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.3f с, SQL: %s за %.3f с, '
+            'шаблоны: %.3f с\n%s',
+            request.method, request.path, view, seconds,
+            request_metrics.queries, request_metrics.db_time,
+            request_metrics.template_time, statements
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Функция')),
+                ('payload', models.TextField(verbose_name='Аргументы (JSON)')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Состояние')),
+                ('priority', models.SmallIntegerField(default=0, help_text='Задачи с большим приоритетом выполняются раньше', verbose_name='Приоритет')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не раньше')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='Попыток всего')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взята')),
+                ('locked_by', models.CharField(blank=True, max_length=200, verbose_name='Воркер')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', '-priority', 'run_at', 'id'], name='core_task_claim_idx'),
+        ),
+    ]
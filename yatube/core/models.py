@@ -0,0 +1,50 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Отложенный вызов функции из core.tasks."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Функция', max_length=200)
+    payload = models.TextField('Аргументы (JSON)')
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    priority = models.SmallIntegerField(
+        'Приоритет',
+        default=0,
+        help_text='Задачи с большим приоритетом выполняются раньше'
+    )
+    run_at = models.DateTimeField('Не раньше', default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Попыток всего', default=5
+    )
+    locked_at = models.DateTimeField('Взята', null=True, blank=True)
+    locked_by = models.CharField('Воркер', max_length=200, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(
+                fields=['status', '-priority', 'run_at', 'id'],
+                name='core_task_claim_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
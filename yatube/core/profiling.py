@@ -0,0 +1,154 @@
+"""Семплирующий профайлер отдельных запросов.
+
+Профилируется запрос с подписанным заголовком X-Profile (токен выдаёт
+make_token() или `manage.py profile_summary --token`), запрос
+сотрудника с ?profile=1 или случайная доля PROFILING_SAMPLE_RATE всех
+запросов. Пока такой запрос выполняется, фоновый поток каждые
+PROFILING_INTERVAL секунд снимает стек его потока через
+sys._current_frames(). Стеки дописываются в PROFILING_DIR в формате
+collapsed stacks («кадр;кадр;кадр число»), по файлу на view: его
+понимают flamegraph.pl и speedscope, а команда profile_summary
+показывает самые горячие кадры.
+"""
+import os
+import random
+import re
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+from .metrics import view_name
+
+HEADER = 'HTTP_X_PROFILE'
+SALT = 'core.profiling'
+SUFFIX = '.collapsed'
+
+_write_lock = threading.Lock()
+
+
+def profiling_dir():
+    return getattr(settings, 'PROFILING_DIR',
+                   os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def make_token():
+    """Значение заголовка X-Profile."""
+    return signing.dumps('profile', salt=SALT)
+
+
+def valid_token(token):
+    try:
+        signing.loads(token, salt=SALT, max_age=getattr(
+            settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60
+        ))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    token = request.META.get(HEADER)
+    if token:
+        return valid_token(token)
+    if request.GET.get('profile') == '1':
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+def frame_label(frame):
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class Sampler(threading.Thread):
+    """Снимает стеки потока thread_id, пока не вызван stop()."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+def stacks_path(view):
+    name = re.sub(r'[^\w.-]', '_', view.replace(':', '.'))
+    return os.path.join(profiling_dir(), name + SUFFIX)
+
+
+def save_stacks(view, stacks):
+    """Дописывает стеки view в его collapsed-файл."""
+    if not stacks:
+        return
+    os.makedirs(profiling_dir(), exist_ok=True)
+    lines = ''.join(f'{stack} {count}\n' for stack, count in stacks.items())
+    with _write_lock, open(stacks_path(view), 'a', encoding='utf-8') as file:
+        file.write(lines)
+
+
+def load_stacks(path):
+    """Стеки collapsed-файла с суммированными повторами."""
+    stacks = Counter()
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+def hottest_frames(stacks, limit=20):
+    """(собственные, включительные) счётчики самых горячих кадров."""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return own.most_common(limit), total.most_common(limit)
+
+
+class ProfilingMiddleware:
+    """Профилирует выбранные запросы; должен стоять после
+    AuthenticationMiddleware, чтобы видеть request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+        sampler = Sampler(
+            threading.get_ident(),
+            getattr(settings, 'PROFILING_INTERVAL', 0.005)
+        )
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.stop()
+        save_stacks(view_name(request), stacks)
+        response['X-Profile-Samples'] = sum(stacks.values())
+        return response
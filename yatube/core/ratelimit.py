@@ -0,0 +1,26 @@
+"""Ограничение частоты дорогих действий по счётчику в кэше.
+
+Счётчик живёт одно окно фиксированной длины: простая схема без
+скользящего окна, но без обращений к базе и общая для всех воркеров,
+если кэш общий.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def retry_after(name, ident, limit, window):
+    """Регистрирует попытку; 0, если она в пределах limit за window
+    секунд, иначе сколько секунд ждать до следующего окна."""
+    now = time.time()
+    key = f'ratelimit:{name}:{ident}:{int(now // window)}'
+    cache.add(key, 0, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # ключ истёк между add и incr: началось новое окно
+        cache.add(key, 1, window)
+        count = 1
+    if count <= limit:
+        return 0
+    return max(1, int(window - now % window))
@@ -0,0 +1,92 @@
+"""Чтение с реплик и «свои записи видны сразу».
+
+ReplicaMiddleware разрешает читать с реплик (DATABASE_REPLICAS) только
+GET-запросам view из REPLICA_READ_VIEWS; всё остальное — записи,
+формы, сессии, фоновые задачи — идёт в default. После записи (любой
+не-GET запрос или view из REPLICA_PIN_VIEWS) браузер получает cookie,
+и REPLICA_LAG_SECONDS его запросы читают с default: реплика могла ещё
+не получить то, что он только что записал.
+
+Данные реплики могут отставать, поэтому posts.cache не кладёт в общий
+кэш то, что прочитано с реплики вскоре после изменения (replica_lag).
+"""
+import random
+import threading
+
+from django.conf import settings
+
+from .metrics import view_name
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# эти приложения читаются только с default: сессия, записанная при
+# входе, должна находиться в следующем же запросе
+PRIMARY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_lag():
+    return getattr(settings, 'REPLICA_LAG_SECONDS', 5)
+
+
+def reading_from_replica():
+    """Текущий поток читает с реплики."""
+    return getattr(_state, 'replica', None) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica is None or model._meta.app_label in PRIMARY_APPS:
+            return 'default'
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии default, объекты из них связываются свободно
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема реплик приходит вместе с репликацией
+        return db not in replicas()
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения запроса и закрепляет писавших за
+    default; должен стоять до views, которые читают базу."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = None
+        if (request.method not in SAFE_METHODS
+                or view_name(request) in self.pin_views()):
+            response.set_cookie(PIN_COOKIE, '1', max_age=replica_lag(),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        available = replicas()
+        if (available and request.method in SAFE_METHODS
+                and PIN_COOKIE not in request.COOKIES
+                and view_name(request) in self.read_views()):
+            # одна реплика на весь запрос: разные реплики могут
+            # отставать по-разному, и страница вышла бы несогласованной
+            _state.replica = random.choice(available)
+
+    def read_views(self):
+        return set(getattr(settings, 'REPLICA_READ_VIEWS', ()))
+
+    def pin_views(self):
+        return set(getattr(settings, 'REPLICA_PIN_VIEWS', ()))
@@ -0,0 +1,337 @@
+"""Очередь фоновых задач в базе.
+
+Функция, обёрнутая @task, вызывается как обычно, а её .delay(...)
+ставит вызов в очередь. Строка задачи пишется в текущей транзакции,
+поэтому воркер увидит её только после коммита вместе с данными, а при
+откате задачи не будет вовсе. Задачи выполняет команда
+`manage.py run_tasks` в несколько потоков.
+
+Очередь — таблица core.Task. Воркер берёт задачу с наибольшим
+приоритетом, чьё время пришло, пропуская функции, у которых уже
+выполняется concurrency задач. Упавшая задача повторяется с
+экспоненциальной паузой, пока не кончатся попытки, затем остаётся в
+таблице со статусом failed и текстом ошибки, а её on_failure получает
+те же аргументы, чтобы оставить данные в окончательном виде.
+
+Пока задача выполняется, воркер раз в треть TASKS_LOCK_TIMEOUT
+обновляет её locked_at. Задачи воркера, который пропал, не закончив,
+через TASKS_LOCK_TIMEOUT снова попадают в очередь; если прежний воркер
+всё же закончит, строку, взятую другим воркером, он не тронет.
+
+С TASKS_EAGER задачи выполняются сразу после коммита в том же
+процессе — для тестов и разработки без воркера.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import update_wrapper
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import (DatabaseError, close_old_connections, connections,
+                       transaction)
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .db import retry_on_locked
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def lock_timeout():
+    return getattr(settings, 'TASKS_LOCK_TIMEOUT', 60 * 10)
+
+
+def retry_delay():
+    return getattr(settings, 'TASKS_RETRY_DELAY', 10)
+
+
+def retry_max_delay():
+    return getattr(settings, 'TASKS_RETRY_MAX_DELAY', 60 * 60)
+
+
+class TaskFunction:
+    """Функция-задача: вызывается напрямую или ставится в очередь."""
+
+    def __init__(self, func, priority=0, max_attempts=5, concurrency=None,
+                 on_failure=None):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.on_failure = on_failure
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def concurrency_limit(self):
+        """Предел одновременных вызовов сейчас: concurrency может быть
+        функцией, например читающей настройку."""
+        if callable(self.concurrency):
+            return self.concurrency()
+        return self.concurrency
+
+    def run_once(self, *args, **kwargs):
+        """Выполняет вызов сразу и без повторов: при ошибке вызывается
+        on_failure, а без него ошибка поднимается дальше."""
+        try:
+            return self.func(*args, **kwargs)
+        except Exception:
+            if self.on_failure is None:
+                raise
+            logger.exception('Задача %s упала', self.name)
+            self.on_failure(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Ставит вызов в очередь; выполнится он после коммита."""
+        if getattr(settings, 'TASKS_EAGER', False):
+            transaction.on_commit(lambda: self.run_once(*args, **kwargs))
+            return None
+        return self.enqueue(args, kwargs)
+
+    def enqueue(self, args=(), kwargs=None, priority=None, countdown=0):
+        """Ставит вызов в очередь сразу; возвращает Task."""
+        payload = json.dumps(
+            {'args': list(args), 'kwargs': kwargs or {}},
+            cls=DjangoJSONEncoder
+        )
+        return Task.objects.create(
+            name=self.name,
+            payload=payload,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=countdown),
+        )
+
+
+def task(func=None, *, priority=0, max_attempts=5, concurrency=None,
+         on_failure=None):
+    """Декоратор задачи; concurrency — сколько её вызовов может
+    выполняться одновременно (None — без ограничения) или функция без
+    аргументов, которая возвращает это число при каждой выборке;
+    on_failure вызывается с аргументами задачи, когда кончились попытки."""
+    def decorator(func):
+        return TaskFunction(func, priority, max_attempts, concurrency,
+                            on_failure)
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def resolve(name):
+    """TaskFunction по имени или None, если её больше нет."""
+    try:
+        found = import_string(name)
+    except ImportError:
+        return None
+    return found if isinstance(found, TaskFunction) else None
+
+
+def busy_names():
+    """Функции, у которых выполняется предельное число задач."""
+    running = Task.objects.filter(status=Task.RUNNING).values(
+        'name'
+    ).annotate(running=Count('id')).order_by()
+    busy = []
+    for row in running:
+        function = resolve(row['name'])
+        if function is None:
+            continue
+        limit = function.concurrency_limit()
+        if limit is not None and row['running'] >= limit:
+            busy.append(row['name'])
+    return busy
+
+
+def release_stale(now):
+    """Возвращает в очередь задачи пропавших воркеров."""
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        locked_at__lt=now - timedelta(seconds=lock_timeout())
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_at=None, locked_by='',
+        last_error='Воркер не закончил задачу'
+    )
+    stale.update(status=Task.QUEUED, locked_at=None, locked_by='')
+
+
+@retry_on_locked
+@transaction.atomic
+def claim(worker):
+    """Берёт следующую задачу для worker или возвращает None."""
+    now = timezone.now()
+    release_stale(now)
+    candidate = Task.objects.filter(
+        status=Task.QUEUED, run_at__lte=now
+    ).exclude(
+        name__in=busy_names()
+    ).order_by('-priority', 'run_at', 'id').first()
+    if candidate is None:
+        return None
+    # условие на статус: задачу мог взять другой воркер между запросами
+    taken = Task.objects.filter(
+        pk=candidate.pk, status=Task.QUEUED
+    ).update(
+        status=Task.RUNNING, locked_at=now, locked_by=worker,
+        attempts=F('attempts') + 1
+    )
+    if not taken:
+        return None
+    candidate.refresh_from_db()
+    return candidate
+
+
+def backoff(attempts):
+    """Пауза перед повтором: растёт вдвое с каждой попыткой."""
+    delay = min(retry_delay() * 2 ** (attempts - 1), retry_max_delay())
+    return delay * random.uniform(0.8, 1.2)
+
+
+def owned(task):
+    """Строка задачи, пока её держит тот же захват (воркер и попытка)."""
+    return Task.objects.filter(
+        pk=task.pk, status=Task.RUNNING,
+        locked_by=task.locked_by, attempts=task.attempts
+    )
+
+
+def touch(task):
+    """Продлевает блокировку выполняемой задачи."""
+    return owned(task).update(locked_at=timezone.now())
+
+
+def beat(task, stop):
+    interval = lock_timeout() / 3
+    try:
+        while not stop.wait(interval):
+            try:
+                touch(task)
+            except DatabaseError:
+                logger.exception('Не удалось продлить задачу %s', task)
+    finally:
+        # соединения потока больше никому не нужны
+        connections.close_all()
+
+
+@contextmanager
+def heartbeat(task):
+    """Продлевает блокировку задачи в отдельном потоке, пока та
+    выполняется, чтобы долгую задачу не взял второй воркер."""
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=beat, args=(task, stop), daemon=True,
+        name=f'{threading.current_thread().name}-heartbeat'
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+@retry_on_locked
+def finish(task, error=None):
+    """Удаляет выполненную задачу или отмечает ошибку; False, если
+    задачу за это время вернули в очередь и взял другой воркер."""
+    if error is None:
+        deleted, _ = owned(task).delete()
+        return bool(deleted)
+    done = task.attempts >= task.max_attempts
+    return bool(owned(task).update(
+        status=Task.FAILED if done else Task.QUEUED,
+        run_at=timezone.now() + timedelta(
+            seconds=0 if done else backoff(task.attempts)
+        ),
+        locked_at=None,
+        locked_by='',
+        last_error=error,
+    ))
+
+
+def execute(task):
+    """Выполняет взятую задачу и отмечает результат."""
+    function = resolve(task.name)
+    payload = None
+    try:
+        if function is None:
+            raise LookupError(f'Нет задачи {task.name}')
+        payload = json.loads(task.payload)
+        with heartbeat(task):
+            function.func(*payload['args'], **payload['kwargs'])
+    except Exception:
+        logger.exception('Задача %s упала (попытка %s из %s)',
+                         task, task.attempts, task.max_attempts)
+        finished = finish(task, traceback.format_exc())
+        if (finished and payload is not None
+                and function.on_failure is not None
+                and task.attempts >= task.max_attempts):
+            give_up(function, payload)
+    else:
+        finished = finish(task)
+    if not finished:
+        logger.warning('Задачу %s уже взял другой воркер', task)
+
+
+def give_up(function, payload):
+    """Вызывает on_failure задачи, у которой кончились попытки."""
+    try:
+        function.on_failure(*payload['args'], **payload['kwargs'])
+    except Exception:
+        logger.exception('on_failure задачи %s упал', function.name)
+
+
+def worker_name():
+    return (f'{socket.gethostname()}:{os.getpid()}:'
+            f'{threading.current_thread().name}')
+
+
+def work(stop, poll_interval=1.0, drain=False):
+    """Цикл потока воркера: до stop или, с drain, до пустой очереди."""
+    name = worker_name()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            task = claim(name)
+            if task is not None:
+                execute(task)
+            elif drain:
+                return
+            else:
+                stop.wait(poll_interval)
+    finally:
+        close_old_connections()
+
+
+def run_workers(concurrency=2, poll_interval=1.0, drain=False, stop=None):
+    """Запускает concurrency потоков и ждёт их завершения."""
+    stop = stop or threading.Event()
+    threads = [
+        threading.Thread(
+            target=work, args=(stop, poll_interval, drain),
+            name=f'tasks-{ind}'
+        )
+        for ind in range(max(1, concurrency))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,22 @@
+"""Шаблонизатор Django, который сообщает время рендеринга в метрики."""
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+
+from . import metrics
+
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        request_metrics = metrics.current()
+        if request_metrics is None:
+            return super().render(context, request)
+        with request_metrics.template():
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -1,6 +1,38 @@
 from http import HTTPStatus
 
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import images
+from posts.models import Post
+
+from . import benchmark, profiling, routers, tasks
+from .db import retry_on_locked
+from .db_backends.sqlite3.base import DatabaseWrapper
+from .metrics import registry
+from .models import Task
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +40,490 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_IMAGE_EAGER=True)
+class BenchmarkTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seeded_pages_respond(self):
+        sample = benchmark.seed(users=5, groups=2, posts=30, comments=20,
+                                follows=6, images=1)
+        urls = benchmark.target_urls(sample)
+        names = {name for name, _ in urls}
+        self.assertIn('posts:post_detail', names)
+        self.assertIn('about:tech', names)
+        self.assertNotIn('users:logout', names)
+        self.client.force_login(sample['reader'])
+        for name, url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertLess(response.status_code,
+                                HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def test_summary_percentiles(self):
+        samples = [(ms / 1000, 2, 200) for ms in range(1, 101)]
+        summary = benchmark.summarize(samples, elapsed=2)
+        self.assertEqual(summary['p50_ms'], 50)
+        self.assertEqual(summary['p95_ms'], 95)
+        self.assertEqual(summary['p99_ms'], 99)
+        self.assertEqual(summary['queries_per_request'], 2)
+        self.assertEqual(summary['requests_per_second'], 50)
+        self.assertEqual(summary['errors'], 0)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def metric(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(' ', 1)[1])
+        self.fail(f'Нет метрики {line_start}')
+
+    def test_requests_are_measured_per_view(self):
+        self.client.get('/')
+        self.client.get('/')
+        text = self.client.get(
+            '/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        view = 'view="posts:index"'
+        self.assertEqual(self.metric(
+            text, 'yatube_request_duration_seconds_count'
+                  f'{{{view},status="200"}}'
+        ), 2)
+        self.assertGreater(
+            self.metric(text, f'yatube_db_queries_sum{{{view}}}'), 0
+        )
+        self.assertGreater(self.metric(
+            text, f'yatube_template_duration_seconds_sum{{{view}}}'
+        ), 0)
+        self.assertGreater(self.metric(
+            text, f'yatube_response_size_bytes_sum{{{view}}}'
+        ), 0)
+        # вторая страница отдана из кэша
+        self.assertGreater(self.metric(
+            text, f'yatube_cache_requests_total{{{view},result="hit"}}'
+        ), 0)
+        self.assertGreater(self.metric(
+            text, f'yatube_cache_requests_total{{{view},result="miss"}}'
+        ), 0)
+
+    def test_endpoint_needs_token_or_staff(self):
+        # за прокси все запросы приходят с локального адреса
+        local = {'REMOTE_ADDR': '127.0.0.1'}
+        for headers, status in (
+            ({}, HTTPStatus.NOT_FOUND),
+            ({'HTTP_AUTHORIZATION': 'Bearer wrong'}, HTTPStatus.NOT_FOUND),
+            ({'HTTP_AUTHORIZATION': 'secret'}, HTTPStatus.NOT_FOUND),
+            ({'HTTP_AUTHORIZATION': 'Bearer secret'}, HTTPStatus.OK),
+        ):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.client.get('/metrics/', **local,
+                                    **headers).status_code,
+                    status
+                )
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(
+                self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ',
+                                **local).status_code,
+                HTTPStatus.NOT_FOUND
+            )
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(
+            self.client.get('/metrics/', **local).status_code, HTTPStatus.OK
+        )
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get('/group/missing/')
+        self.assertIn('posts:group_posts', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+@override_settings(PROFILING_DIR=tempfile.mkdtemp(dir=settings.BASE_DIR),
+                   PROFILING_INTERVAL=0.001)
+class ProfilingTest(TestCase):
+    def tearDown(self):
+        shutil.rmtree(settings.PROFILING_DIR, ignore_errors=True)
+
+    def test_sampler_collects_stacks_of_thread(self):
+        sampler = profiling.Sampler(threading.get_ident(), 0.001)
+        sampler.start()
+        time.sleep(0.05)
+        stacks = sampler.stop()
+        self.assertTrue(stacks)
+        self.assertTrue(all(
+            'test_sampler_collects_stacks_of_thread' in stack
+            for stack in stacks
+        ))
+
+    def test_profiling_is_opt_in(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        user = User.objects.create_user(username='user')
+        cases = (
+            (None, {}, {}, False),
+            (None, {'profile': '1'}, {}, False),
+            (user, {'profile': '1'}, {}, False),
+            (None, {}, {'HTTP_X_PROFILE': 'forged'}, False),
+            (None, {}, {'HTTP_X_PROFILE': profiling.make_token()}, True),
+            (staff, {'profile': '1'}, {}, True),
+        )
+        for login, params, headers, profiled in cases:
+            with self.subTest(login=login, params=params, headers=headers):
+                self.client.logout()
+                if login is not None:
+                    self.client.force_login(login)
+                response = self.client.get('/', params, **headers)
+                self.assertEqual(
+                    response.has_header('X-Profile-Samples'), profiled
+                )
+
+    def test_summary_of_saved_stacks(self):
+        profiling.save_stacks('posts:profile', Counter({
+            'main;view;render': 3,
+            'main;view;query': 1,
+        }))
+        profiling.save_stacks('posts:profile', Counter({'main;view': 1}))
+        out = StringIO()
+        call_command('profile_summary', view='posts:profile', stdout=out)
+        output = out.getvalue()
+        self.assertIn('posts.profile: 5 семплов', output)
+        self.assertRegex(output, r'60\.0%\s+3\s+render')
+        self.assertRegex(output, r'100\.0%\s+5\s+main')
+
+
+class SqliteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def wrapper(self, **options):
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(self.workdir, 'db.sqlite3'),
+            'OPTIONS': options,
+        })
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_get_pragmas(self):
+        wrapper = self.wrapper(pragmas={'busy_timeout': 1234})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(wrapper, 'foreign_keys'), 1)
+
+    def test_transactions_take_write_lock_at_begin(self):
+        second = self.wrapper(pragmas={'busy_timeout': 0})
+        second.ensure_connection()
+        for mode, locked in (('immediate', True), ('deferred', False)):
+            with self.subTest(mode=mode):
+                first = self.wrapper(transaction_mode=mode)
+                first._start_transaction_under_autocommit()
+                try:
+                    if locked:
+                        with self.assertRaisesMessage(OperationalError,
+                                                      'database is locked'):
+                            second._start_transaction_under_autocommit()
+                    else:
+                        second._start_transaction_under_autocommit()
+                        second.cursor().execute('ROLLBACK')
+                finally:
+                    first.cursor().execute('ROLLBACK')
+
+    def test_health_check_reopens_broken_connection(self):
+        wrapper = self.wrapper()
+        wrapper.settings_dict['CONN_HEALTH_CHECKS'] = True
+        wrapper.ensure_connection()
+        wrapper.connection.close()
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+
+
+@override_settings(DB_LOCK_RETRIES=2, DB_LOCK_RETRY_DELAY=0)
+class RetryOnLockedTest(SimpleTestCase):
+    def failing(self, failures, message='database is locked'):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return len(calls)
+        return write, calls
+
+    def test_locked_writes_are_retried(self):
+        write, _ = self.failing(2)
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(write(), 3)
+
+    def test_gives_up_after_retries(self):
+        write, calls = self.failing(5)
+        with self.assertLogs('core.db', 'WARNING'):
+            with self.assertRaises(OperationalError):
+                write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.failing(1, 'no such table: posts_post')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_SECONDS=5)
+class ReplicaRouterTest(TransactionTestCase):
+    """default и файл-реплика, которую тест обновляет сам."""
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.workdir, 'replica.sqlite3')
+        connections.databases['replica'] = {
+            **connection.settings_dict, 'NAME': cls.replica_path
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.author, text='Старый')
+        self.replicate()
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def replicate(self):
+        connections['replica'].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+
+    def test_read_views_use_replica(self):
+        Post.objects.create(author=self.author, text='Новый')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Старый')
+        self.assertNotContains(response, 'Новый')
+        self.assertContains(self.client.get(reverse('api:feed')), 'Новый')
+        self.assertFalse(routers.reading_from_replica())
+
+    def test_lagging_replica_pages_are_not_cached(self):
+        Post.objects.create(author=self.author, text='Новый')
+        self.assertNotContains(self.client.get(reverse('posts:index')),
+                               'Новый')
+        self.replicate()
+        self.assertContains(self.client.get(reverse('posts:index')), 'Новый')
+
+    def test_writers_read_their_writes(self):
+        self.client.force_login(self.reader)
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Мой комментарий'}
+        )
+        self.assertEqual(
+            response.cookies[routers.PIN_COOKIE]['max-age'], 5
+        )
+        self.assertContains(self.client.get(self.detail), 'Мой комментарий')
+        other = self.client_class()
+        self.assertNotContains(other.get(self.detail), 'Мой комментарий')
+
+    def test_get_writes_pin_too(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertContains(
+            self.client.get(reverse(
+                'posts:profile', kwargs={'username': 'author'}
+            )),
+            'Отписаться'
+        )
+
+
+CALLS = []
+
+
+@tasks.task(max_attempts=2)
+def record(value):
+    CALLS.append(value)
+
+
+@tasks.task(max_attempts=2)
+def explode():
+    raise ValueError('Сломалось')
+
+
+@tasks.task(concurrency=1)
+def single():
+    pass
+
+
+@override_settings(TASKS_RETRY_DELAY=10, TASKS_LOCK_TIMEOUT=60)
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_queued_task_runs_once(self):
+        record.delay(1)
+        self.assertEqual(CALLS, [])
+        task = tasks.claim('worker')
+        self.assertEqual(task.status, Task.RUNNING)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNone(tasks.claim('other'))
+        tasks.execute(task)
+        self.assertEqual(CALLS, [1])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        explode.delay()
+        tasks.execute(tasks.claim('worker'))
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertIn('Сломалось', task.last_error)
+        delay = (task.run_at - timezone.now()).total_seconds()
+        self.assertTrue(7 < delay <= 12, delay)
+        self.assertIsNone(tasks.claim('worker'))
+
+        Task.objects.update(run_at=timezone.now())
+        tasks.execute(tasks.claim('worker'))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertIsNone(tasks.claim('worker'))
+
+    def test_higher_priority_runs_first(self):
+        record.enqueue((1,))
+        record.enqueue((2,), priority=5)
+        tasks.execute(tasks.claim('worker'))
+        tasks.execute(tasks.claim('worker'))
+        self.assertEqual(CALLS, [2, 1])
+
+    def test_concurrency_limit(self):
+        single.delay()
+        single.delay()
+        record.delay(1)
+        first = tasks.claim('worker')
+        self.assertEqual(first.name, single.name)
+        self.assertEqual(tasks.claim('worker').name, record.name)
+        self.assertIsNone(tasks.claim('worker'))
+        tasks.execute(first)
+        self.assertEqual(tasks.claim('worker').name, single.name)
+
+    def test_concurrency_limit_follows_settings(self):
+        for post_id in range(3):
+            images.process_image.delay(post_id)
+        with self.settings(POSTS_IMAGE_WORKERS=1):
+            self.assertIsNotNone(tasks.claim('worker'))
+            self.assertIsNone(tasks.claim('worker'))
+        with self.settings(POSTS_IMAGE_WORKERS=2):
+            self.assertIsNotNone(tasks.claim('worker'))
+            self.assertIsNone(tasks.claim('worker'))
+
+    def test_abandoned_task_is_requeued(self):
+        record.delay(1)
+        task = tasks.claim('lost')
+        Task.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        again = tasks.claim('worker')
+        self.assertEqual(again.pk, task.pk)
+        self.assertEqual(again.attempts, 2)
+        self.assertEqual(again.locked_by, 'worker')
+
+    def test_finish_leaves_task_taken_by_other_worker(self):
+        record.delay(1)
+        task = tasks.claim('slow')
+        # задачу сочли брошенной и отдали другому воркеру
+        Task.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        again = tasks.claim('worker')
+        tasks.execute(task)
+        self.assertEqual(CALLS, [1])
+        again.refresh_from_db()
+        self.assertEqual(
+            (again.status, again.locked_by), (Task.RUNNING, 'worker')
+        )
+        self.assertFalse(tasks.finish(task, 'Ошибка'))
+        self.assertTrue(tasks.finish(again))
+        self.assertFalse(Task.objects.exists())
+
+    def test_running_task_keeps_its_lock(self):
+        record.enqueue((1,))
+        task = tasks.claim('worker')
+        Task.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(tasks.touch(task), 1)
+        self.assertIsNone(tasks.claim('other'))
+        with self.settings(TASKS_LOCK_TIMEOUT=0.03), \
+                mock.patch.object(tasks, 'touch') as touch, \
+                mock.patch.object(record, 'func',
+                                  side_effect=lambda value: time.sleep(0.1)):
+            tasks.execute(task)
+        touch.assert_called_with(task)
+
+    def test_password_reset_mail_is_sent_by_worker(self):
+        user = User.objects.create_user(
+            username='reader', email='reader@yatube.ru', password='secret'
+        )
+        response = self.client.post(
+            reverse('users:password_reset_form'),
+            {'email': 'reader@yatube.ru'}
+        )
+        self.assertRedirects(response, reverse('users:password_reset_done'))
+        self.assertEqual(mail.outbox, [])
+        task = Task.objects.get()
+        self.assertEqual(task.name, 'users.tasks.send_password_reset')
+        # в очереди нет ссылки сброса, только id и адрес сайта
+        self.assertEqual(json.loads(task.payload)['args'],
+                         [user.pk, 'testserver', False])
+        tasks.work(threading.Event(), drain=True)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@yatube.ru'])
+        self.assertIn('http://testserver/auth/reset/', mail.outbox[0].body)
+
+    def test_task_payload_is_hidden_in_admin(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@yatube.ru', password='secret'
+        )
+        task = record.enqueue(('секрет',))
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:core_task_change', args=[task.pk])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotContains(response, 'секрет')
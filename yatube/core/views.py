@@ -1,4 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .metrics import registry
 
 
 def page_not_found(request, exception):
@@ -7,3 +12,27 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_token_valid(request):
+    """Заголовок Authorization: Bearer <METRICS_TOKEN>.
+
+    Адрес клиента не проверяется: за обратным прокси все запросы
+    приходят с 127.0.0.1.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, value = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and (
+        constant_time_compare(value.strip(), token)
+    )
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus: по токену или для персонала."""
+    if not request.user.is_staff and not metrics_token_valid(request):
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
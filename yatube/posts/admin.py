@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post, Comment
 
 
@@ -15,6 +16,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     list_editable = ('group',)
     empty_value_display = '-пусто-'
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        ids, _ = search.search_ids(search_term, limit=self.search_limit)
+        return queryset.filter(pk__in=ids), False
 
 
 admin.site.register(Post, PostAdmin)
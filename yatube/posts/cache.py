@@ -0,0 +1,252 @@
+"""Кэш лент, общий для всех пользователей.
+
+Карточки постов и пагинатор рендерятся один раз без данных о текущем
+пользователе и кэшируются по view, области (группа, автор), странице
+и версиям контента. Всё персональное (шапка, кнопка «Изменить»,
+подписка) собирается поверх при каждом запросе.
+
+Версии — счётчики поколений по областям: вся лента, группа, автор,
+пост, подписки пользователя, его подписчики и «сайт» (редкие
+изменения, задевающие все карточки: имена пользователей, слаги
+групп). Любой кэш, встроивший версию в ключ, не отдаст устаревшие
+данные после записи, поэтому TTL может быть долгим — но только если
+кэш общий для всех процессов сайта. Кэш в памяти процесса
+(LocMemCache) не видит версий, поднятых в других воркерах, поэтому с
+ним и записи, и сами версии живут коротко (POSTS_LOCAL_CACHE_TIMEOUT):
+это предел, на который страница может отстать от записи в другом
+процессе.
+
+Вместе с версией область хранит время последнего изменения: по нему
+условные GET (posts.conditional) отдают Last-Modified.
+"""
+import hashlib
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.functional import SimpleLazyObject
+from django.utils.safestring import mark_safe
+
+from core import routers
+
+from .thumbnails import resolve_thumbnails
+from .utils import paginate
+
+FEED = 'feed'
+GROUP = 'group'
+AUTHOR = 'author'
+POST = 'post'
+FOLLOW = 'follow'
+FOLLOWERS = 'followers'
+SITE = 'site'
+
+EDIT_MARKER = re.compile(r'<!--edit:(\d+):(\d+)-->')
+
+
+def shared_cache():
+    """Кэш по умолчанию общий для процессов, а не в памяти одного."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def cache_timeout():
+    if not shared_cache():
+        return getattr(settings, 'POSTS_LOCAL_CACHE_TIMEOUT', 60)
+    return getattr(settings, 'POSTS_CACHE_TIMEOUT', 60 * 60 * 6)
+
+
+def version_timeout():
+    """Время жизни версий: в общем кэше бессрочно, в локальном — как
+    у записей, иначе поднятые другими воркерами версии не дошли бы
+    сюда никогда, и ETag оставался бы прежним."""
+    return cache_timeout() if not shared_cache() else None
+
+
+def version_key(scope, kind='version'):
+    if isinstance(scope, tuple):
+        scope = ':'.join(str(part) for part in scope)
+    return f'posts:{kind}:{scope}'
+
+
+def modified_stamp():
+    # вверх до секунды: Last-Modified не точнее секунды, и правка в ту
+    # же секунду, что и прошлая выдача страницы, не должна дать 304
+    return math.ceil(time.time())
+
+
+def initial_version():
+    # версия, созданная заново после вытеснения из кэша, не совпадает
+    # с прежними: иначе старый ETag снова считался бы свежим
+    return time.time_ns() // 1000
+
+
+def get_versions(*scopes):
+    """Текущие версии областей одним запросом к кэшу.
+
+    Область — строка (FEED, SITE) или пара (GROUP, id).
+    """
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for scope, key in zip(scopes, keys):
+        if key not in found:
+            version = initial_version()
+            if cache.add(key, version, version_timeout()):
+                # о прошлых изменениях ничего не известно: считаем,
+                # что область изменилась сейчас
+                cache.set(version_key(scope, 'modified'), modified_stamp(),
+                          version_timeout())
+            found[key] = cache.get(key, version)
+    return [found[key] for key in keys]
+
+
+def modified_at(*scopes):
+    """Время (unix, секунды) последнего изменения любой из областей.
+
+    None, если время хотя бы одной неизвестно (вытеснено из кэша) —
+    тогда и Last-Modified отдавать нельзя.
+    """
+    keys = [version_key(scope, 'modified') for scope in scopes]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return max(found.values())
+
+
+def replica_may_lag(*scopes):
+    """Чтение идёт с реплики, а области менялись недавно.
+
+    Реплика могла ещё не получить изменение, и прочитанное с неё нельзя
+    кэшировать под текущими версиями: устаревшие данные жили бы до
+    следующей записи.
+    """
+    if not routers.reading_from_replica():
+        return False
+    stamp = modified_at(*scopes)
+    return stamp is None or time.time() - stamp < routers.replica_lag()
+
+
+def _incr(scopes):
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_version(), version_timeout())
+    stamp = modified_stamp()
+    cache.set_many(
+        {version_key(scope, 'modified'): stamp for scope in scopes},
+        version_timeout()
+    )
+
+
+def bump(*scopes):
+    """Инвалидирует всё, что закэшировано под версиями этих областей.
+
+    Версия поднимается сразу и ещё раз после коммита: иначе читатель,
+    успевший между ними закэшировать старые данные, держал бы их до TTL.
+    """
+    scopes = {
+        scope for scope in scopes
+        if not isinstance(scope, tuple) or scope[1] is not None
+    }
+    _incr(scopes)
+    transaction.on_commit(lambda: _incr(scopes))
+
+
+def make_key(*parts, prefix='list'):
+    raw = ':'.join(str(part) for part in parts)
+    return f'posts:{prefix}:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def render_many(template, name, objects, key_parts, context=None,
+                prepare=None):
+    """Рендерит фрагмент для каждого объекта с кэшем на объект.
+
+    Все готовые фрагменты читаются одним get_many, новые пишутся
+    одним set_many, так что страница стоит одного обращения к кэшу.
+    prepare получает список объектов, которые придётся рендерить.
+    """
+    keys = [make_key(*key_parts(obj), prefix=name) for obj in objects]
+    found = cache.get_many(keys)
+    if prepare is not None:
+        prepare([obj for key, obj in zip(keys, objects) if key not in found])
+    missing = {}
+    for key, obj in zip(keys, objects):
+        if key not in found:
+            missing[key] = found[key] = render_to_string(
+                template, {**(context or {}), name: obj}
+            )
+    if missing:
+        cache.set_many(missing, cache_timeout())
+    return [mark_safe(found[key]) for key in keys]
+
+
+def render_cards(posts, view_name):
+    """Карточки постов; ключ — id поста и время его изменения."""
+    site, = get_versions(SITE)
+    return render_many(
+        'includes/card.html', 'post', list(posts),
+        lambda post: (view_name, post.pk, post.updated.timestamp(), site),
+        {'view_name': view_name},
+        prepare=lambda posts: resolve_thumbnails(posts, generate=False),
+    )
+
+
+def comment_key_parts(comment, site):
+    return (comment.pk, site)
+
+
+def render_comments(comments):
+    """Блоки комментариев; комментарии не редактируются на сайте,
+    правки из админки сбрасывает forget_comment()."""
+    site, = get_versions(SITE)
+    return render_many(
+        'posts/includes/comment.html', 'comment', list(comments),
+        lambda comment: comment_key_parts(comment, site),
+    )
+
+
+def forget_comment(comment):
+    site, = get_versions(SITE)
+    cache.delete(make_key(*comment_key_parts(comment, site), prefix='comment'))
+
+
+def personalize(html, user):
+    """Подставляет кнопку «Изменить» в карточки постов пользователя."""
+    user_id = str(user.pk) if user.is_authenticated else None
+
+    def replace(match):
+        if match.group(2) != user_id:
+            return ''
+        return render_to_string(
+            'posts/includes/edit_button.html',
+            {'post_id': match.group(1)}
+        )
+
+    return mark_safe(EDIT_MARKER.sub(replace, html))
+
+
+def cached_post_list(request, post_list, view_name, scope=FEED):
+    """Возвращает (page_obj, html) для ленты view_name из области scope.
+
+    page_obj ленивый: при попадании в кэш запросы к постам не выполняются.
+    """
+    page_obj = SimpleLazyObject(
+        lambda: paginate(request, post_list, view_name)
+    )
+    page = request.GET.get('cursor') or request.GET.get('page') or ''
+    key = make_key(view_name, scope, page, *get_versions(scope, SITE))
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('posts/includes/post_list.html', {
+            'page_obj': page_obj,
+            'view_name': view_name,
+            'shared': True,
+        })
+        if not replica_may_lag(scope, SITE):
+            cache.set(key, html, cache_timeout())
+    return page_obj, personalize(html, request.user)
@@ -0,0 +1,139 @@
+"""Условные GET страниц поста, профиля и группы.
+
+ETag и Last-Modified считаются без выполнения view: по id объекта
+берутся версии и времена изменения областей posts.cache, из которых
+собрана страница. Версии поднимают те же сигналы, что сбрасывают кэш,
+так что браузер и CDN получают 304, пока ни одна область не
+изменилась, и страница не рендерится вовсе. Сами id (автор поста,
+пользователь по username, группа по слагу) тоже кэшируются, поэтому
+ответ 304 обходится без запросов к базе.
+
+ETag учитывает зрителя (шапка, кнопки «Изменить» и «Подписаться»,
+CSRF-токен формы комментария). Last-Modified отдаётся только анонимам:
+он не различает пользователей, а If-Modified-Since без If-None-Match
+иначе вернул бы 304 на страницу, собранную для другого зрителя.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import (AUTHOR, FOLLOW, FOLLOWERS, GROUP, POST, SITE,
+                    cache_timeout, get_versions, make_key, modified_at,
+                    replica_may_lag)
+from .models import Group, Post, User
+
+
+def conditional(scopes):
+    """Декоратор view со страницей из областей scopes(request, **kwargs).
+
+    scopes возвращает список областей или None, если объекта нет: тогда
+    заголовки не считаются и view сама отдаёт 404.
+    """
+    def page_scopes(request, *args, **kwargs):
+        if not hasattr(request, '_page_scopes'):
+            found = scopes(request, *args, **kwargs)
+            if found is not None:
+                found = [*found, SITE]
+                # страницу с отстающей реплики нельзя выдать под
+                # новыми версиями: браузер держал бы её до следующей записи
+                if replica_may_lag(*found):
+                    found = None
+            request._page_scopes = found
+        return request._page_scopes
+
+    def etag(request, *args, **kwargs):
+        found = page_scopes(request, *args, **kwargs)
+        if found is None:
+            return None
+        raw = ':'.join(str(part) for part in (
+            request.get_full_path(),
+            request.user.pk,
+            request.META.get('CSRF_COOKIE', ''),
+            *get_versions(*found),
+        ))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        found = page_scopes(request, *args, **kwargs)
+        stamp = found and modified_at(*found)
+        if not stamp:
+            return None
+        return datetime.fromtimestamp(stamp, tz=timezone.utc)
+
+    def decorator(view):
+        conditioned = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditioned(request, *args, **kwargs)
+            # без no-cache браузер по Last-Modified сам решил бы, сколько
+            # держать страницу, не спрашивая сервер
+            patch_cache_control(
+                response, no_cache=True,
+                private=request.user.is_authenticated
+            )
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_id(queryset, *key_parts):
+    """Первое значение values_list queryset из кэша; None не кэшируется."""
+    key = make_key(*key_parts, prefix='page-id')
+    found = cache.get(key)
+    if found is None:
+        found = queryset.first()
+        if found is not None:
+            cache.set(key, found, cache_timeout())
+    return found
+
+
+def viewer_scopes(request):
+    """Области, от которых зависит персональная часть страницы."""
+    if request.user.is_authenticated:
+        return [(FOLLOW, request.user.pk)]
+    return []
+
+
+def post_detail_scopes(request, post_id):
+    # автор поста не меняется, а удаление поднимет версию поста
+    author_id = cached_id(
+        Post.objects.filter(pk=post_id).values_list('author_id', flat=True),
+        'post-author', post_id
+    )
+    if author_id is None:
+        return None
+    # число постов автора в карточке меняется с его версией
+    return [(POST, post_id), (AUTHOR, author_id)]
+
+
+def profile_scopes(request, username):
+    # переименование поднимает версию SITE
+    author_id = cached_id(
+        User.objects.filter(username=username).values_list('pk', flat=True),
+        'user', username, *get_versions(SITE)
+    )
+    if author_id is None:
+        return None
+    return [
+        (AUTHOR, author_id),
+        (FOLLOW, author_id),
+        (FOLLOWERS, author_id),
+        *viewer_scopes(request),
+    ]
+
+
+def group_posts_scopes(request, slug):
+    group_id = cached_id(
+        Group.objects.filter(slug=slug).values_list('pk', flat=True),
+        'group', slug, *get_versions(SITE)
+    )
+    if group_id is None:
+        return None
+    return [(GROUP, group_id)]
@@ -0,0 +1,50 @@
+"""Пересчёт денормализованных счётчиков по фактическим данным."""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import (Comment, FeedEntry, Follow, Group, Post, User,
+                     UserStats)
+
+COUNTERS = (
+    (UserStats, 'posts_count', Post, 'author'),
+    (UserStats, 'followers_count', Follow, 'author'),
+    (UserStats, 'following_count', Follow, 'user'),
+    (Group, 'posts_count', Post, 'group'),
+    (Post, 'comments_count', Comment, 'post'),
+    (FeedEntry, 'comments_count', Comment, 'post'),
+)
+
+
+def actual_count(source, field):
+    """Коррелированный подзапрос с фактическим числом строк source."""
+    rows = source.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(cnt=Count('pk')).values('cnt')
+    return Coalesce(Subquery(rows), 0)
+
+
+@transaction.atomic
+def repair_counters(dry_run=False):
+    """Находит и исправляет расхождения; возвращает их число по счётчикам."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    if not dry_run:
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in missing.iterator()],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+    drift = {}
+    for model, field, source, fk in COUNTERS:
+        stale = model.objects.annotate(
+            actual=actual_count(source, fk)
+        ).exclude(**{field: F('actual')})
+        label = f'{model._meta.label}.{field}'
+        drift[label] = stale.count()
+        if drift[label] and not dry_run:
+            model.objects.filter(pk__in=stale.values('pk')).update(
+                **{field: actual_count(source, fk)}
+            )
+    return drift
@@ -0,0 +1,152 @@
+"""Денормализованная модель лент (FeedEntry).
+
+Запись повторяет пост вместе со всем, что показывает карточка: имя
+автора, слаг и название группы, начало текста, адрес миниатюры и
+счётчики. Записи обновляются при сохранении поста, обработке его
+картинки, переименовании автора и изменении группы, поэтому ленты
+index, group и profile читают одну таблицу без соединений.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import FeedEntry, Post
+from .thumbnails import resolve_thumbnails
+
+
+def text_length():
+    return getattr(settings, 'POSTS_FEED_TEXT_LENGTH', 1000)
+
+
+def build_entry(post, generate_thumbnails=False):
+    """FeedEntry для поста с загруженными автором и группой.
+
+    Без generate_thumbnails адрес миниатюры берётся только из кэша:
+    запись строится в транзакции сохранения поста, а миниатюры создаёт
+    задача обработки картинки (posts.images).
+    """
+    author = post.author
+    group = post.group if post.group_id else None
+    resolve_thumbnails([post], generate=generate_thumbnails)
+    return FeedEntry(
+        post_id=post.pk,
+        author_id=post.author_id,
+        group_id=post.group_id,
+        pub_date=post.pub_date,
+        updated=post.updated,
+        author_username=author.username,
+        author_name=author.get_full_name(),
+        group_slug=group.slug if group else '',
+        group_title=group.title if group else '',
+        text=Truncator(post.text).chars(text_length()),
+        image_pending=post.image_pending,
+        thumbnail_url=getattr(post, 'thumbnail_url', ''),
+        comments_count=post.comments_count,
+    )
+
+
+ENTRY_FIELDS = [
+    field.attname for field in FeedEntry._meta.concrete_fields
+    if not field.primary_key
+]
+
+
+def sync_posts(queryset, batch_size=500, generate_thumbnails=False):
+    """Пересоздаёт записи постов queryset пачками."""
+    posts = queryset.select_related('author', 'group').order_by('pk')
+    batch = []
+    total = 0
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.append(build_entry(post, generate_thumbnails))
+        if len(batch) >= batch_size:
+            total += _save(batch)
+            batch = []
+    return total + _save(batch)
+
+
+def _save(entries):
+    if not entries:
+        return 0
+    FeedEntry.objects.filter(
+        pk__in=[entry.pk for entry in entries]
+    ).delete()
+    FeedEntry.objects.bulk_create(entries)
+    return len(entries)
+
+
+def sync_post(post):
+    """Обновляет запись одного поста после его сохранения."""
+    entry = build_entry(post)
+    fields = ENTRY_FIELDS
+    if post.image and not post.image_pending and not entry.thumbnail_url:
+        # адрес вытеснен из кэша: сохранённый в записи по-прежнему верен
+        fields = [name for name in fields if name != 'thumbnail_url']
+    updated = FeedEntry.objects.filter(pk=post.pk).update(
+        **{name: getattr(entry, name) for name in fields}
+    )
+    if not updated:
+        entry.save(force_insert=True)
+
+
+def store_thumbnails(urls, batch_size=500):
+    """Записывает адреса миниатюр карточек {имя картинки: адрес}.
+
+    У постов, чей адрес изменился, сдвигается updated: карточки в кэше
+    любого процесса привязаны к нему и построятся заново. Возвращает
+    число таких постов.
+    """
+    names = list(urls)
+    changed = 0
+    for start in range(0, len(names), batch_size):
+        rows = FeedEntry.objects.filter(
+            post__image__in=names[start:start + batch_size],
+            image_pending=False
+        ).values_list('pk', 'post__image', 'thumbnail_url')
+        stale = {}
+        for pk, name, url in rows:
+            if url != urls[name]:
+                stale.setdefault(urls[name], []).append(pk)
+        now = timezone.now()
+        for url, ids in stale.items():
+            with transaction.atomic():
+                Post.objects.filter(pk__in=ids).update(updated=now)
+                FeedEntry.objects.filter(pk__in=ids).update(
+                    thumbnail_url=url, updated=now
+                )
+            changed += len(ids)
+    return changed
+
+
+def rename_author(user):
+    FeedEntry.objects.filter(author_id=user.pk).update(
+        author_username=user.username,
+        author_name=user.get_full_name(),
+        updated=timezone.now(),
+    )
+
+
+def change_group(group):
+    FeedEntry.objects.filter(group_id=group.pk).update(
+        group_slug=group.slug,
+        group_title=group.title,
+        updated=timezone.now(),
+    )
+
+
+def forget_group(group):
+    """Убирает группу из записей до того, как её удалят."""
+    FeedEntry.objects.filter(group_id=group.pk).update(
+        group_slug='',
+        group_title='',
+        updated=timezone.now(),
+    )
+
+
+@transaction.atomic
+def rebuild(batch_size=500):
+    """Пересоздаёт все записи; возвращает их число."""
+    FeedEntry.objects.all().delete()
+    # вне запросов: недостающие миниатюры можно построить здесь же
+    return sync_posts(Post.objects.all(), batch_size,
+                      generate_thumbnails=True)
@@ -0,0 +1,99 @@
+"""Выгрузка истории пользователя: его посты и комментарии.
+
+Ответ собирается генератором для StreamingHttpResponse: строки
+читаются из базы через iterator(chunk_size) и уходят клиенту кусками
+по CHUNK_SIZE байт, при желании сжатыми gzip на лету. Ни выгрузка
+целиком, ни весь набор строк в памяти не держатся, сколько бы постов
+ни было у автора.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CSV_COLUMNS = ('type', 'id', 'post_id', 'date', 'group', 'image', 'text')
+ROWS_CHUNK = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def history(user, chunk_size=ROWS_CHUNK):
+    """Словари постов, затем комментариев user по порядку id."""
+    posts = Post.objects.filter(author=user).order_by('pk').values_list(
+        'pk', 'pub_date', 'group__slug', 'image', 'text'
+    )
+    for pk, pub_date, group, image, text in posts.iterator(chunk_size):
+        yield {
+            'type': 'post', 'id': pk, 'post_id': pk, 'date': pub_date,
+            'group': group or '', 'image': image, 'text': text,
+        }
+    comments = Comment.objects.filter(author=user).order_by(
+        'pk'
+    ).values_list('pk', 'post_id', 'created', 'text')
+    for pk, post_id, created, text in comments.iterator(chunk_size):
+        yield {
+            'type': 'comment', 'id': pk, 'post_id': post_id,
+            'date': created, 'group': '', 'image': '', 'text': text,
+        }
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder,
+                         ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Буфер для csv.writer: writerow сразу возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row['date'].isoformat() if name == 'date' else row[name]
+            for name in CSV_COLUMNS
+        ])
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Склеивает строки в байтовые куски не меньше size."""
+    parts = []
+    length = 0
+    for line in lines:
+        data = line.encode()
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(parts)
+            parts = []
+            length = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzipped(chunks):
+    """Сжимает поток кусков в формат gzip, не накапливая его."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(user, data_format, compress=False):
+    """Куски выгрузки user в формате data_format (ключ FORMATS)."""
+    lines = ndjson_lines if data_format == 'ndjson' else csv_lines
+    chunks = chunked(lines(history(user)))
+    return gzipped(chunks) if compress else chunks
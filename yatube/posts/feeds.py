@@ -0,0 +1,232 @@
+"""Лента подписок с раздачей постов при записи (fan-out-on-write).
+
+Новый пост сразу раскладывается по лентам подписчиков автора, поэтому
+чтение ленты — выборка по индексу (user, pub_date) без соединения с Follow.
+У авторов с очень большим числом подписчиков раздача слишком дорога:
+их посты не раскладываются, а подмешиваются при чтении.
+
+Режим автора хранится в UserStats.feed_pull и меняется вместе со
+счётчиком подписчиков, а не вычисляется по кэшу: пока флаг стоит,
+лента читает посты автора напрямую, поэтому ни один пост не теряется.
+Автор, которого подписчиков стало меньше FOLLOW_FEED_FANOUT_LIMIT,
+сначала раскладывается по всем лентам фоновой задачей, и только
+потом флаг снимается.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from core.tasks import task
+
+from .follows import followed_ids
+from .models import Follow, FollowFeedItem, Post, UserStats
+
+FANOUT_BATCH_SIZE = 500
+# порядок ленты по колонкам записи ленты: так страница читается
+# по индексу (user, pub_date, post) без сортировки
+FOLLOW_FEED_ORDERING = ('-feed_pub_date', '-feed_post_id')
+
+
+def fanout_limit():
+    return getattr(settings, 'FOLLOW_FEED_FANOUT_LIMIT', 1000)
+
+
+def pull_authors(author_ids):
+    """Те из author_ids, чьи посты не разложены по лентам."""
+    if not author_ids:
+        return set()
+    return set(UserStats.objects.filter(
+        user_id__in=author_ids, feed_pull=True
+    ).values_list('user_id', flat=True))
+
+
+def is_pulled(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, feed_pull=True
+    ).exists()
+
+
+def follower_added(author_id):
+    """Переводит автора на подмешивание, когда подписчиков набралось
+    fanout_limit(); уже разложенные посты остаются в лентах."""
+    UserStats.objects.filter(
+        user_id=author_id,
+        feed_pull=False,
+        followers_count__gte=fanout_limit()
+    ).update(feed_pull=True)
+
+
+def follower_removed(author_id):
+    """Ставит раздачу постов автора в очередь, когда подписчиков стало
+    меньше fanout_limit()."""
+    if UserStats.objects.filter(
+        user_id=author_id,
+        feed_pull=True,
+        followers_count__lt=fanout_limit()
+    ).exists():
+        materialize_author.delay(author_id)
+
+
+def _bulk_insert(items):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FollowFeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FollowFeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(
+        FollowFeedItem(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    _bulk_insert(
+        FollowFeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def _fan_out_posts(posts):
+    """Раскладывает посты posts по лентам всех подписчиков их авторов."""
+    rows = posts.filter(
+        author__following__isnull=False
+    ).values_list('author__following__user_id', 'pk', 'pub_date')
+    _bulk_insert(
+        FollowFeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for user_id, post_id, pub_date in rows.iterator()
+    )
+
+
+@task(concurrency=1)
+def materialize_author(author_id):
+    """Раскладывает посты автора по лентам и снимает подмешивание."""
+    with transaction.atomic():
+        stats = UserStats.objects.filter(
+            user_id=author_id,
+            feed_pull=True,
+            followers_count__lt=fanout_limit()
+        )
+        # подписчики могли вернуться, пока задача ждала в очереди
+        if not stats.exists():
+            return
+        _fan_out_posts(Post.objects.filter(author_id=author_id))
+        stats.update(feed_pull=False)
+
+
+def rebuild():
+    """Раскладывает все посты заново, например после массовой загрузки
+    без сигналов; «тяжёлые» авторы отмечаются и пропускаются."""
+    FollowFeedItem.objects.all().delete()
+    UserStats.objects.update(feed_pull=False)
+    UserStats.objects.filter(
+        followers_count__gte=fanout_limit()
+    ).update(feed_pull=True)
+    pulled = UserStats.objects.filter(feed_pull=True).values('user_id')
+    _fan_out_posts(Post.objects.exclude(author_id__in=pulled))
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FollowFeedItem.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+class MergedFeed:
+    """Лента из нескольких выборок, каждая из которых читается по своему
+    индексу в порядке ленты.
+
+    Условие OR по материализованной ленте и по «тяжёлым» авторам SQLite
+    не читает по индексу и сортирует всю выборку во временном B-дереве.
+    Здесь каждая часть — ветка UNION ALL, которую SQLite берёт диапазоном
+    своего индекса, а ветки сливает (MERGE) до LIMIT страницы. Выборка
+    полей и условия курсора применяются к каждой ветке; для пагинации
+    объект ведёт себя как QuerySet.
+    """
+
+    def __init__(self, branches, ordering=()):
+        self.branches = branches
+        self.ordering = ordering
+        self.model = branches[0].model
+        # аннотации веток одинаковы: по ним курсор разбирает позицию
+        self.query = branches[0].query
+
+    def _each(self, method, *args, **kwargs):
+        return MergedFeed(
+            [getattr(branch, method)(*args, **kwargs)
+             for branch in self.branches],
+            self.ordering
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._each('filter', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._each('select_related', *fields)
+
+    def only(self, *fields):
+        return self._each('only', *fields)
+
+    def order_by(self, *ordering):
+        return MergedFeed(self.branches, ordering)
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    def merged(self):
+        first, *rest = [branch.order_by() for branch in self.branches]
+        return first.union(*rest, all=True).order_by(*self.ordering)
+
+    def count(self):
+        return sum(branch.count() for branch in self.branches)
+
+    def __getitem__(self, index):
+        return self.merged()[index]
+
+    def __iter__(self):
+        return iter(self.merged())
+
+    def __len__(self):
+        return len(self.merged())
+
+
+def follow_feed(user):
+    """Посты ленты подписок: материализованная часть плюс «тяжёлые» авторы.
+
+    Сортировать результат нужно по FOLLOW_FEED_ORDERING.
+    """
+    pulled = pull_authors(followed_ids(user))
+    materialized = Post.objects.filter(
+        follow_feed_items__user=user
+    ).annotate(
+        feed_pub_date=F('follow_feed_items__pub_date'),
+        feed_post_id=F('follow_feed_items__post_id'),
+    )
+    if not pulled:
+        return materialized
+    # разложенные раньше посты «тяжёлого» автора читаются его веткой
+    branches = [materialized.exclude(author_id__in=pulled)]
+    for author_id in sorted(pulled):
+        branches.append(Post.objects.filter(author_id=author_id).annotate(
+            feed_pub_date=F('pub_date'), feed_post_id=F('id')
+        ))
+    return MergedFeed(branches)
@@ -0,0 +1,38 @@
+"""Граф подписок зрителя.
+
+Множество id авторов, на которых подписан пользователь, читается из
+базы один раз и кэшируется под версией его подписок (FOLLOW), которую
+поднимают сигналы Follow, так что подписка и отписка сразу сбрасывают
+кэш. Внутри запроса множество хранится на request: проверка подписки
+для любого числа авторов на странице — O(1) без запросов к базе.
+"""
+from django.core.cache import cache
+
+from .cache import (FOLLOW, cache_timeout, get_versions, make_key,
+                    replica_may_lag)
+from .models import Follow
+
+
+def followed_ids(user):
+    """frozenset id авторов, на которых подписан user."""
+    if not user.is_authenticated:
+        return frozenset()
+    version, = get_versions((FOLLOW, user.pk))
+    key = make_key(user.pk, version, prefix='following')
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        if not replica_may_lag((FOLLOW, user.pk)):
+            cache.set(key, ids, cache_timeout())
+    return ids
+
+
+def following(request):
+    """followed_ids() текущего пользователя, один раз на запрос."""
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = followed_ids(request.user)
+    return request._followed_ids
@@ -0,0 +1,138 @@
+"""Обработка картинок постов вне запроса.
+
+После сохранения поста с новой картинкой её обработка ставится в
+очередь фоновых задач (core.tasks): оригинал ограничивается по размеру и
+пересохраняется без метаданных (EXIF, GPS), затем заранее создаются все
+миниатюры, которые используют шаблоны. Пока обработка идёт, пост
+помечен image_ready=False, и шаблоны показывают заглушку вместо
+миниатюры, так что ни один запрос страницы не ресайзит картинку.
+
+Ошибка обработки (например, временный сбой хранилища) поднимается в
+очередь, и та повторяет задачу. Когда попытки кончились, пост
+публикуется без миниатюры (image_unavailable).
+"""
+import io
+import logging
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from core.tasks import task
+
+from . import cache, entries
+from .models import Post
+from .thumbnails import THUMBNAIL_SIZES, remember
+
+logger = logging.getLogger(__name__)
+
+REENCODE_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def max_size():
+    return getattr(settings, 'POSTS_IMAGE_MAX_SIZE', (1920, 1920))
+
+
+def workers():
+    return getattr(settings, 'POSTS_IMAGE_WORKERS', 2)
+
+
+def prepare_original(field):
+    """Поворачивает по EXIF, ограничивает размер и убирает метаданные."""
+    with field.storage.open(field.name, 'rb') as source:
+        image = Image.open(source)
+        image_format = image.format
+        if image_format not in REENCODE_FORMATS:
+            # GIF и прочее (в том числе анимацию) оставляем как есть
+            return
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size())
+    buffer = io.BytesIO()
+    # без exif=… и pnginfo Pillow не переносит метаданные в новый файл
+    image.save(buffer, format=image_format, quality=90, optimize=True)
+    with field.storage.open(field.name, 'wb') as target:
+        target.write(buffer.getvalue())
+
+
+def build_thumbnails(field):
+    for spec in THUMBNAIL_SIZES:
+        geometry, options = spec
+        remember(field.name, get_thumbnail(field, geometry, **options).url,
+                 spec)
+
+
+def mark_ready(post_id, generate_thumbnails):
+    """Снимает заглушку с поста и обновляет его запись и кэш."""
+    post = Post.objects.only('id', 'author_id', 'group_id').filter(
+        pk=post_id
+    ).first()
+    if post is None:
+        return
+    Post.objects.filter(pk=post_id).update(
+        image_ready=True, updated=timezone.now()
+    )
+    entries.sync_posts(Post.objects.filter(pk=post_id),
+                       generate_thumbnails=generate_thumbnails)
+    cache.bump(
+        cache.FEED,
+        (cache.AUTHOR, post.author_id),
+        (cache.GROUP, post.group_id),
+        (cache.POST, post.pk),
+    )
+
+
+def image_unavailable(post_id):
+    """Публикует пост, картинку которого так и не удалось обработать.
+
+    Миниатюры в кэше нет, поэтому карточка и страница поста выходят без
+    картинки, а не с вечной заглушкой; ресайз при показе не нужен.
+    """
+    logger.error('Картинка поста %s не обработана, пост показан без неё',
+                 post_id)
+    close_old_connections()
+    try:
+        mark_ready(post_id, generate_thumbnails=False)
+    finally:
+        close_old_connections()
+
+
+@task(priority=10, max_attempts=3, concurrency=workers,
+      on_failure=image_unavailable)
+def process_image(post_id):
+    """Обрабатывает картинку поста и помечает её готовой."""
+    close_old_connections()
+    try:
+        post = Post.objects.only('id', 'image').filter(pk=post_id).first()
+        if post is None:
+            return
+        if post.image:
+            prepare_original(post.image)
+            build_thumbnails(post.image)
+        mark_ready(post_id, generate_thumbnails=True)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Ставит обработку картинки поста в очередь."""
+    if getattr(settings, 'POSTS_IMAGE_EAGER', False):
+        transaction.on_commit(lambda: process_image.run_once(post.pk))
+    else:
+        process_image.delay(post.pk)
+
+
+def save_post_form(form, **fields):
+    """Сохраняет PostForm; новую картинку отправляет на обработку."""
+    post = form.save(commit=False)
+    for name, value in fields.items():
+        setattr(post, name, value)
+    new_image = 'image' in form.changed_data and bool(post.image)
+    if new_image:
+        post.image_ready = False
+    post.save()
+    if new_image:
+        schedule(post)
+    return post
@@ -0,0 +1,54 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии и '
+            'подписки в NDJSON или каталог CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл NDJSON (.gz — со сжатием, - — stdout) '
+                 'или каталог для CSV'
+        )
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'), default='ndjson'
+        )
+        parser.add_argument(
+            '--models',
+            help=f'Через запятую из: {", ".join(transfer.MODELS)}'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help='Сколько строк читать из базы за раз'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        names = options['models'] and options['models'].split(',')
+        try:
+            if options['format'] == 'csv':
+                totals = transfer.export_csv(path, names,
+                                             options['batch_size'])
+            elif path == '-':
+                totals = transfer.export_ndjson(sys.stdout, names,
+                                                options['batch_size'])
+            else:
+                opener = gzip.open if path.endswith('.gz') else open
+                with opener(path, 'wt', encoding='utf-8') as stream:
+                    totals = transfer.export_ndjson(stream, names,
+                                                    options['batch_size'])
+        except ValueError as error:
+            raise CommandError(error)
+        # при выгрузке в stdout итог не должен смешиваться с данными
+        report = self.stderr if path == '-' else self.stdout
+        for name, total in totals.items():
+            report.write(f'{name}: {total}')
+        report.write(self.style.SUCCESS('Выгрузка завершена'))
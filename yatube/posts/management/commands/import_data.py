@@ -0,0 +1,88 @@
+import gzip
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает данные, выгруженные export_data, пачками '
+            'bulk_create и пересчитывает производные данные')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл NDJSON (.gz — со сжатием, - — stdin) '
+                 'или каталог с CSV'
+        )
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'),
+            help='По умолчанию csv для каталога, иначе ndjson'
+        )
+        parser.add_argument(
+            '--models',
+            help=f'Через запятую из: {", ".join(transfer.MODELS)}'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help='Сколько объектов вставлять за одну транзакцию'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки: повторный запуск с ним '
+                 'продолжит с первой незагруженной пачки'
+        )
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс '
+                 '(например, перед загрузкой следующей части)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        names = options['models'] and options['models'].split(',')
+        data_format = options['format'] or (
+            'csv' if os.path.isdir(path) else 'ndjson'
+        )
+        checkpoint = transfer.Checkpoint(options['checkpoint'])
+        try:
+            if data_format == 'csv':
+                loaded = self.load(transfer.read_csv(path, names), names,
+                                   checkpoint, options)
+            elif path == '-':
+                loaded = self.load(transfer.read_ndjson(sys.stdin), names,
+                                   checkpoint, options)
+            else:
+                opener = gzip.open if path.endswith('.gz') else open
+                with opener(path, 'rt', encoding='utf-8') as stream:
+                    loaded = self.load(transfer.read_ndjson(stream), names,
+                                       checkpoint, options)
+        except (ValueError, DatabaseError) as error:
+            if options['checkpoint']:
+                error = (f'{error}; загруженные пачки учтены, повторный '
+                         f'запуск с тем же --checkpoint продолжит с места '
+                         f'ошибки')
+            raise CommandError(error)
+        totals, skipped = loaded
+        for name, total in totals.items():
+            self.stdout.write(f'{name}: {total}')
+            if skipped.get(name):
+                self.stdout.write(
+                    f'{name}: уже были в базе и пропущены: {skipped[name]}'
+                )
+        if not options['skip_derived']:
+            self.stdout.write('Пересчёт счётчиков, лент и поиска…')
+            transfer.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена'))
+
+    def load(self, records, names, checkpoint, options):
+        return transfer.import_records(
+            records, names, options['batch_size'], checkpoint,
+            stdout=self.stdout if options['verbosity'] > 1 else None
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import entries
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт записи лент (FeedEntry) по всем постам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько записей создавать за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        total = entries.rebuild(options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Записи лент пересозданы: {total}')
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт полнотекстовый индекс постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов индексировать за одну транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        total = search.rebuild(options['batch_size'], stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(f'Индекс перестроен, постов: {total}')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя'
+        )
+
+    def handle(self, *args, **options):
+        drift = repair_counters(dry_run=options['dry_run'])
+        for counter, stale in drift.items():
+            self.stdout.write(f'{counter}: {stale}')
+        if options['dry_run']:
+            self.stdout.write('Изменения не сохранены (--dry-run)')
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import entries
+from posts.models import Post
+from posts.thumbnails import (CARD_THUMBNAIL, THUMBNAIL_SIZES, remember,
+                              thumbnail_url)
+
+
+def _init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def build(name):
+    """Создаёт все миниатюры картинки; возвращает их адреса."""
+    try:
+        return name, [thumbnail_url(name, spec) for spec in THUMBNAIL_SIZES]
+    except Exception as error:
+        return name, error
+
+
+class Command(BaseCommand):
+    help = 'Заранее создаёт миниатюры для картинок всех постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию — число ядер)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image='')
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        names = list(names.iterator())
+        workers = max(1, options['workers'])
+        if workers == 1:
+            results = map(build, names)
+        else:
+            # дочерние процессы не должны делить соединение с БД родителя
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker)
+            results = pool.map(build, names, chunksize=options['chunk_size'])
+        done = failed = 0
+        card_urls = {}
+        for name, urls in results:
+            if isinstance(urls, Exception):
+                failed += 1
+                self.stderr.write(f'{name}: {urls}')
+                continue
+            for spec, url in zip(THUMBNAIL_SIZES, urls):
+                remember(name, url, spec)
+                if spec == CARD_THUMBNAIL:
+                    card_urls[name] = url
+            done += 1
+        if workers > 1:
+            pool.shutdown()
+        # кэш адресов виден web-процессам, только если бэкенд общий
+        # (Memcached, Redis), а LocMemCache исчезнет вместе с командой;
+        # адрес в FeedEntry страницы найдут в любом процессе
+        changed = entries.store_thumbnails(card_urls)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово миниатюр: {done}, ошибок: {failed}, '
+            f'обновлено карточек: {changed}'
+        ))
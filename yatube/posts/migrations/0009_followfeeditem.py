@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_follow_feeds(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FollowFeedItem = apps.get_model('posts', 'FollowFeedItem')
+    for follow in Follow.objects.iterator():
+        FollowFeedItem.objects.bulk_create(
+            [
+                FollowFeedItem(
+                    user_id=follow.user_id,
+                    post_id=post_id,
+                    pub_date=pub_date
+                )
+                for post_id, pub_date in Post.objects.filter(
+                    author_id=follow.author_id
+                ).values_list('id', 'pub_date')
+            ],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_post_ordering_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowFeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_feed_items', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_feed', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='followfeeditem',
+            index=models.Index(fields=['user', '-pub_date'], name='posts_feed_user_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='followfeeditem',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(
+            backfill_follow_feeds, migrations.RunPython.noop
+        ),
+    ]
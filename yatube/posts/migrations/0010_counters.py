@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('posts', 'UserStats')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+
+    def count(source, field):
+        rows = source.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(cnt=Count('pk')).values('cnt')
+        return Coalesce(Subquery(rows), 0)
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in User.objects.values_list(
+            'pk', flat=True
+        )],
+        batch_size=500
+    )
+    UserStats.objects.update(
+        posts_count=count(Post, 'author'),
+        followers_count=count(Follow, 'author'),
+        following_count=count(Follow, 'user'),
+    )
+    Group.objects.update(posts_count=count(Post, 'group'))
+    Post.objects.update(comments_count=count(Comment, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0009_followfeeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
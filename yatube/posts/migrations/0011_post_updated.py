@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:15
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def updated_from_pub_date(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(updated_from_pub_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+from django.db import OperationalError, migrations, transaction
+
+FTS_TABLE = 'posts_post_fts'
+
+
+BATCH_SIZE = 1000
+
+
+def document(post):
+    return (
+        post.pk,
+        post.text,
+        post.group.title if post.group_id else '',
+        ' '.join(filter(None, (
+            post.author.first_name,
+            post.author.last_name,
+            post.author.username,
+        ))),
+    )
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                    'USING fts5(text, group_title, author_name, '
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+        except OperationalError:
+            # SQLite собран без FTS5: поиск работает через icontains
+            return
+        posts = Post.objects.select_related('author', 'group').order_by('pk')
+        batch = []
+        for post in posts.iterator(chunk_size=BATCH_SIZE):
+            batch.append(document(post))
+            if len(batch) >= BATCH_SIZE:
+                insert(cursor, batch)
+                batch = []
+        insert(cursor, batch)
+
+
+def insert(cursor, rows):
+    if rows:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text, group_title, author_name)'
+            ' VALUES (%s, %s, %s, %s)',
+            rows
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
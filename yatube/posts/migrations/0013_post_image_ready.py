@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_ready',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Картинка обработана'),
+        ),
+    ]
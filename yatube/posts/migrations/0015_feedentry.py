@@ -0,0 +1,85 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+TEXT_LENGTH = 1000
+
+
+def fill_entries(apps, schema_editor):
+    # адреса миниатюр заполнит `manage.py rebuild_feed_entries`:
+    # sorl в миграции недоступен
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    batch = []
+    posts = Post.objects.select_related('author', 'group').iterator()
+    for post in posts:
+        author = post.author
+        group = post.group
+        text = post.text
+        if len(text) > TEXT_LENGTH:
+            text = text[:TEXT_LENGTH - 1] + '…'
+        batch.append(FeedEntry(
+            post_id=post.pk,
+            author_id=post.author_id,
+            group_id=post.group_id,
+            pub_date=post.pub_date,
+            updated=post.updated,
+            author_username=author.username,
+            author_name=f'{author.first_name} {author.last_name}'.strip(),
+            group_slug=group.slug if group else '',
+            group_title=group.title if group else '',
+            text=text,
+            image_pending=bool(post.image) and not post.image_ready,
+            comments_count=post.comments_count,
+        ))
+        if len(batch) >= 500:
+            FeedEntry.objects.bulk_create(batch)
+            batch = []
+    FeedEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0014_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_entry', serialize=False, to='posts.Post')),
+                ('pub_date', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('author_username', models.CharField(max_length=150)),
+                ('author_name', models.CharField(blank=True, max_length=301)),
+                ('group_slug', models.CharField(blank=True, max_length=50)),
+                ('group_title', models.CharField(blank=True, max_length=200)),
+                ('text', models.TextField()),
+                ('image_pending', models.BooleanField(default=False)),
+                ('thumbnail_url', models.CharField(blank=True, max_length=500)),
+                ('comments_count', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='feed_entries', to='posts.Group')),
+            ],
+            options={
+                'ordering': ['-pub_date', '-post_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['-pub_date', '-post'], name='posts_entry_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['author', '-pub_date', '-post'], name='posts_entry_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['group', '-pub_date', '-post'], name='posts_entry_group_date_idx'),
+        ),
+        migrations.RunPython(fill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_authors(apps, schema_editor):
+    """Отмечает «тяжёлых» авторов и заново раскладывает посты остальных:
+    раньше посты автора, вышедшего из подмешивания, в ленты не попадали."""
+    UserStats = apps.get_model('posts', 'UserStats')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FollowFeedItem = apps.get_model('posts', 'FollowFeedItem')
+    limit = getattr(settings, 'FOLLOW_FEED_FANOUT_LIMIT', 1000)
+    UserStats.objects.filter(followers_count__gte=limit).update(
+        feed_pull=True
+    )
+    pulled = UserStats.objects.filter(feed_pull=True).values('user_id')
+    for follow in Follow.objects.exclude(author_id__in=pulled).iterator():
+        FollowFeedItem.objects.bulk_create(
+            [
+                FollowFeedItem(
+                    user_id=follow.user_id,
+                    post_id=post_id,
+                    pub_date=pub_date
+                )
+                for post_id, pub_date in Post.objects.filter(
+                    author_id=follow.author_id
+                ).values_list('id', 'pub_date')
+            ],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_pull',
+            field=models.BooleanField(default=False, help_text='Посты автора не разложены по лентам подписчиков (posts.feeds)', verbose_name='Посты подмешиваются в ленты подписок при чтении'),
+        ),
+        migrations.RunPython(
+            mark_pulled_authors, migrations.RunPython.noop
+        ),
+    ]
@@ -8,11 +8,41 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return self.title
 
 
+class PostManager(models.Manager):
+    def bulk_create(self, objs, *args, sync_entries=True, **kwargs):
+        """bulk_create без сигналов, но с записями лент (FeedEntry).
+
+        Счётчики, ленты подписок и поисковый индекс bulk_create не
+        обновляет. sync_entries=False — для массовой загрузки, после
+        которой производные данные пересчитываются целиком
+        (posts.transfer.rebuild_derived).
+        """
+        if not sync_entries:
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        # SQLite не возвращает id вставленных строк: новые посты —
+        # те, что получили id после нынешнего максимума
+        last = self.aggregate(last=models.Max('pk'))['last'] or 0
+        created = super().bulk_create(objs, *args, **kwargs)
+        given = [obj.pk for obj in objs if obj.pk is not None]
+        # импорт здесь: entries сам зависит от моделей
+        from . import entries
+        entries.sync_posts(self.filter(
+            models.Q(pk__gt=last) | models.Q(pk__in=given)
+        ))
+        return created
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -22,6 +52,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -42,13 +76,116 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    image_ready = models.BooleanField(
+        'Картинка обработана',
+        default=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostManager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        # индексы повторяют порядок лент, чтобы страница читалась
+        # по индексу без сортировки во временном B-дереве
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='posts_post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='posts_post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='posts_post_group_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    # те же имена, что у полей FeedEntry: карточка рисует и то, и другое
+    @property
+    def author_name(self):
+        return self.author.get_full_name()
+
+    @property
+    def author_username(self):
+        return self.author.username
+
+    @property
+    def group_slug(self):
+        return self.group.slug if self.group_id else ''
+
+    @property
+    def group_title(self):
+        return self.group.title if self.group_id else ''
+
+    @property
+    def image_pending(self):
+        return bool(self.image) and not self.image_ready
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # группа на момент загрузки нужна, чтобы перенести счётчики
+        # при смене группы поста
+        instance._loaded_group_id = instance.__dict__.get('group_id')
+        return instance
+
+
+class UserStatsManager(models.Manager):
+    def for_user(self, user):
+        """Счётчики пользователя; недостающая запись создаётся по факту.
+
+        Если счётчики загружены вместе с пользователем
+        (select_related('stats')), отдельного запроса нет.
+        """
+        try:
+            return user.stats
+        except self.model.DoesNotExist:
+            stats, _ = self.get_or_create(user=user, defaults={
+                'posts_count': user.posts.count(),
+                'followers_count': user.following.count(),
+                'following_count': user.follower.count(),
+            })
+            user.stats = stats
+            return stats
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+    feed_pull = models.BooleanField(
+        'Посты подмешиваются в ленты подписок при чтении',
+        default=False,
+        help_text='Посты автора не разложены по лентам подписчиков '
+                  '(posts.feeds)'
+    )
+
+    objects = UserStatsManager()
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -68,6 +205,15 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='posts_comment_post_date_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -83,3 +229,88 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author')
+
+
+class FollowFeedItem(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follow_feed'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='follow_feed_items'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='posts_feed_user_date_idx'
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Готовая к показу карточка поста для лент index, group и profile.
+
+    Всё, что нужно карточке, лежит в одной узкой таблице: лента
+    читается по индексу без соединений с User и Group. Записи
+    поддерживает posts.entries по сигналам.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='feed_entry'
+    )
+    # отдельные индексы по внешним ключам не нужны: их покрывают
+    # составные индексы ниже
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        db_index=False
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='feed_entries',
+        blank=True,
+        null=True,
+        db_index=False
+    )
+    pub_date = models.DateTimeField()
+    updated = models.DateTimeField()
+    author_username = models.CharField(max_length=150)
+    author_name = models.CharField(max_length=301, blank=True)
+    group_slug = models.CharField(max_length=50, blank=True)
+    group_title = models.CharField(max_length=200, blank=True)
+    text = models.TextField()
+    image_pending = models.BooleanField(default=False)
+    thumbnail_url = models.CharField(max_length=500, blank=True)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-post'],
+                name='posts_entry_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-post'],
+                name='posts_entry_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-post'],
+                name='posts_entry_group_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
@@ -0,0 +1,73 @@
+"""Общие выборки для лент и страницы поста.
+
+Все списки постов строятся через feed_posts(), чтобы карточки получали
+автора и группу одним JOIN, а не отдельным запросом на каждый пост.
+Независимые данные страницы (счётчики автора) подтягиваются в тот же
+запрос, что и главный объект, а не отдельными обращениями к базе.
+"""
+from .models import Comment, Post, User
+from .utils import CNT_COMMENTS, CursorPaginator
+
+CARD_FIELDS = (
+    'id',
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'image_ready',
+    'comments_count',
+    'author__id',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__id',
+    'group__slug',
+    'group__title',
+)
+
+COMMENT_FIELDS = (
+    'id',
+    'post_id',
+    'text',
+    'created',
+    'author__id',
+    'author__username',
+)
+
+
+def feed_posts(queryset=None):
+    """Посты для карточек: автор и группа в том же запросе, без лишних
+    колонок (пароль автора, описание группы)."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author', 'group').only(*CARD_FIELDS)
+
+
+def post_comments(queryset=None):
+    """Комментарии вместе с авторами."""
+    if queryset is None:
+        queryset = Comment.objects.all()
+    return queryset.select_related('author').only(*COMMENT_FIELDS)
+
+
+def post_detail(queryset=None):
+    """Пост для отдельной страницы со счётчиками автора; комментарии
+    читаются отдельно страницами (comment_page)."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author__stats', 'group')
+
+
+def comment_page(post_id, cursor=None, per_page=CNT_COMMENTS):
+    """Страница комментариев поста по курсору на (created, id)."""
+    paginator = CursorPaginator(
+        post_comments(Comment.objects.filter(post_id=post_id)),
+        per_page,
+        ordering=('created', 'id')
+    )
+    return paginator.get_page(cursor)
+
+
+def profile_author():
+    """Автор профиля вместе со счётчиками."""
+    return User.objects.select_related('stats')
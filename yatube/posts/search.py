@@ -0,0 +1,196 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Таблица posts_post_fts хранит по строке на пост (rowid = id поста):
+текст, название группы и имя автора. Индекс обновляется по сигналам
+при каждом сохранении и удалении, так что поиск — выборка из индекса,
+а не LIKE '%…%' по всей таблице постов. На других СУБД или без FTS5
+поиск откатывается на icontains.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+
+from core.tasks import task
+
+from .models import Post
+from .utils import CursorPage, CursorPaginator, decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_post_fts'
+# веса bm25 для колонок text, group_title, author_name
+RANK = f'bm25({FTS_TABLE}, 1.0, 0.5, 0.5)'
+TOKEN = re.compile(r'\w+')
+
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "text, group_title, author_name, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+_available = None
+
+
+def available():
+    """Есть ли в базе таблица FTS5 (проверяется один раз на процесс)."""
+    global _available
+    if _available is None:
+        _available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def document(post):
+    """Индексируемые поля поста."""
+    group_title = post.group.title if post.group_id else ''
+    author = post.author
+    author_name = ' '.join(filter(None, (
+        author.get_full_name(), author.username
+    )))
+    return post.pk, post.text, group_title, author_name
+
+
+def index_posts(posts):
+    """Добавляет или обновляет посты в индексе."""
+    if not available():
+        return
+    rows = [document(post) for post in posts]
+    if not rows:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(row[0],) for row in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text, group_title, author_name)'
+            ' VALUES (%s, %s, %s, %s)',
+            rows
+        )
+
+
+def unindex_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def indexed_posts(queryset=None):
+    """Посты с полями, нужными для документа индекса."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author', 'group').only(
+        'id', 'text', 'group__title', 'author__username',
+        'author__first_name', 'author__last_name',
+    ).order_by('pk')
+
+
+def reindex(queryset=None, batch_size=1000, stdout=None):
+    """Переиндексирует посты queryset пачками по batch_size."""
+    total = 0
+    batch = []
+    for post in indexed_posts(queryset).iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            index_posts(batch)
+            total += len(batch)
+            batch = []
+            if stdout is not None:
+                stdout.write(f'Проиндексировано постов: {total}')
+    index_posts(batch)
+    return total + len(batch)
+
+
+@task
+def reindex_author(author_id):
+    """Обновляет имя автора в индексе всех его постов."""
+    reindex(Post.objects.filter(author_id=author_id))
+
+
+@task
+def reindex_group(group_id):
+    """Обновляет название группы в индексе её постов."""
+    reindex(Post.objects.filter(group_id=group_id))
+
+
+def rebuild(batch_size=1000, stdout=None):
+    """Создаёт индекс заново и заполняет его всеми постами; без FTS5
+    в сборке SQLite ничего не делает."""
+    global _available
+    if connection.vendor != 'sqlite':
+        return 0
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DROP_SQL)
+            cursor.execute(CREATE_SQL)
+    except OperationalError:
+        if stdout is not None:
+            stdout.write('SQLite без FTS5: поиск работает без индекса')
+        return 0
+    finally:
+        _available = None
+    return reindex(batch_size=batch_size, stdout=stdout)
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение MATCH: все слова, по префиксу.
+
+    Слова берутся в кавычки, поэтому синтаксис FTS5 из запроса не
+    исполняется и не ломает поиск.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN.findall(query))
+
+
+def search_ids(query, cursor=None, limit=10):
+    """Id найденных постов по релевантности и токен следующей страницы."""
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+    params = [expression]
+    seek = ''
+    position = decode_cursor(cursor)
+    if position is not None and position[0] == 'n':
+        try:
+            score, last_id = float(position[1][0]), int(position[1][1])
+        except (IndexError, TypeError, ValueError):
+            pass
+        else:
+            seek = 'WHERE score > %s OR (score = %s AND post_id > %s)'
+            params += [score, score, last_id]
+    sql = (
+        f'SELECT post_id, score FROM ('
+        f'SELECT rowid AS post_id, {RANK} AS score FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s) {seek} '
+        f'ORDER BY score, post_id LIMIT %s'
+    )
+    params.append(limit + 1)
+    try:
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            rows = db_cursor.fetchall()
+    except OperationalError:
+        return [], None
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_id, last_score = rows[-1]
+        next_cursor = encode_cursor('n', [last_score, last_id])
+    return [post_id for post_id, _ in rows], next_cursor
+
+
+def search_page(query, queryset, cursor=None, per_page=10):
+    """Страница результатов поиска в виде CursorPage."""
+    if not available():
+        paginator = CursorPaginator(
+            queryset.filter(text__icontains=query), per_page
+        )
+        page = paginator.get_page(cursor)
+        page.previous_cursor = None
+        return page
+    ids, next_cursor = search_ids(query, cursor, per_page)
+    posts = queryset.in_bulk(ids)
+    return CursorPage(
+        [posts[pk] for pk in ids if pk in posts], next_cursor, None
+    )
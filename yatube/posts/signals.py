@@ -0,0 +1,188 @@
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import cache, entries, feeds, search
+from .models import (Comment, FeedEntry, Follow, Group, Post, User,
+                     UserStats)
+
+
+def _shift(queryset, delta, field):
+    """Сдвигает счётчик в БД, не уводя его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    queryset.update(**{field: F(field) + delta})
+
+
+USER_CARD_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _card(user):
+    return tuple(getattr(user, name) for name in USER_CARD_FIELDS)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # save() без update_fields бывает и при смене пароля, и при любой
+    # правке в админке: запоминаем имя до записи, чтобы сравнить после
+    instance._card_before = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not (
+        set(USER_CARD_FIELDS) & set(update_fields)
+    ):
+        return
+    instance._card_before = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*USER_CARD_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+        return
+    before = getattr(instance, '_card_before', None)
+    if before is not None and before != _card(instance):
+        # имя автора есть в карточках любых лент
+        cache.bump(cache.SITE)
+        entries.rename_author(instance)
+        search.reindex_author.delay(instance.pk)
+
+
+GROUP_CARD_FIELDS = ('title', 'slug')
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # правка описания в админке не меняет карточек постов группы
+    instance._card_before = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not (
+        set(GROUP_CARD_FIELDS) & set(update_fields)
+    ):
+        return
+    instance._card_before = Group.objects.filter(
+        pk=instance.pk
+    ).values_list(*GROUP_CARD_FIELDS).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    before = getattr(instance, '_card_before', None)
+    if before is None:
+        return
+    title, slug = before
+    if (title, slug) != (instance.title, instance.slug):
+        # название и ссылка группы есть в карточках любых лент
+        cache.bump(cache.SITE)
+        entries.change_group(instance)
+    if title != instance.title:
+        search.reindex_group.delay(instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # посты теряют группу через SET_NULL без сигналов
+    entries.forget_group(instance)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    cache.bump(cache.SITE)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_group_id = getattr(instance, '_loaded_group_id', None)
+    if created:
+        _shift(UserStats.objects.filter(user_id=instance.author_id), 1,
+               'posts_count')
+        old_group_id = None
+    if old_group_id != instance.group_id:
+        if old_group_id is not None:
+            _shift(Group.objects.filter(pk=old_group_id), -1, 'posts_count')
+        if instance.group_id is not None:
+            _shift(Group.objects.filter(pk=instance.group_id), 1,
+                   'posts_count')
+    instance._loaded_group_id = instance.group_id
+    if created:
+        feeds.fan_out_post(instance)
+    search.index_posts([instance])
+    entries.sync_post(instance)
+    cache.bump(
+        cache.FEED,
+        (cache.AUTHOR, instance.author_id),
+        (cache.GROUP, instance.group_id),
+        (cache.GROUP, old_group_id),
+        (cache.POST, instance.pk),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _shift(UserStats.objects.filter(user_id=instance.author_id), -1,
+           'posts_count')
+    if instance.group_id is not None:
+        _shift(Group.objects.filter(pk=instance.group_id), -1, 'posts_count')
+    search.unindex_post(instance.pk)
+    cache.bump(
+        cache.FEED,
+        (cache.AUTHOR, instance.author_id),
+        (cache.GROUP, instance.group_id),
+        (cache.POST, instance.pk),
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _shift(Post.objects.filter(pk=instance.post_id), 1, 'comments_count')
+        _shift(FeedEntry.objects.filter(pk=instance.post_id), 1,
+               'comments_count')
+    else:
+        cache.forget_comment(instance)
+    cache.bump((cache.POST, instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    _shift(Post.objects.filter(pk=instance.post_id), -1, 'comments_count')
+    _shift(FeedEntry.objects.filter(pk=instance.post_id), -1,
+           'comments_count')
+    cache.bump((cache.POST, instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _shift(UserStats.objects.filter(user_id=instance.author_id), 1,
+               'followers_count')
+        _shift(UserStats.objects.filter(user_id=instance.user_id), 1,
+               'following_count')
+        feeds.follower_added(instance.author_id)
+        feeds.backfill(instance.user_id, instance.author_id)
+        cache.bump((cache.FOLLOW, instance.user_id),
+                   (cache.FOLLOWERS, instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    _shift(UserStats.objects.filter(user_id=instance.author_id), -1,
+           'followers_count')
+    _shift(UserStats.objects.filter(user_id=instance.user_id), -1,
+           'following_count')
+    feeds.prune(instance.user_id, instance.author_id)
+    feeds.follower_removed(instance.author_id)
+    cache.bump((cache.FOLLOW, instance.user_id),
+               (cache.FOLLOWERS, instance.author_id))
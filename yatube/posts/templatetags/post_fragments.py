@@ -0,0 +1,27 @@
+from django import template
+
+from posts.cache import personalize, render_cards, render_comments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Карточки постов из кэша фрагментов.
+
+    Внутри общего для всех фрагмента (shared) кнопки «Изменить»
+    остаются маркерами, иначе подставляются для текущего пользователя.
+    """
+    view_name = context.get('view_name')
+    request = context.get('request')
+    if not view_name and request is not None:
+        view_name = request.resolver_match.view_name
+    cards = render_cards(posts, view_name)
+    if context.get('shared') or request is None:
+        return cards
+    return [personalize(card, request.user) for card in cards]
+
+
+@register.simple_tag
+def comment_blocks(comments):
+    return render_comments(comments)
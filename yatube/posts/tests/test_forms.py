@@ -1,14 +1,23 @@
+import io
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from core import tasks
+from core.models import Task
+
+from .. import images, thumbnails
 from ..forms import PostForm, CommentForm
-from ..models import Group, Post, Comment
+from ..models import Comment, FeedEntry, Group, Post
 
 User = get_user_model()
 
@@ -178,3 +187,151 @@ class PostCreateFormTests(TestCase):
                 text='test',
             ).exists()
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POSTS_IMAGE_MAX_SIZE=(100, 100))
+class ImagePipelineTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='HasNoName')
+        self.client.force_login(self.user)
+
+    def upload(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (400, 200), 'red').save(
+            buffer, format='JPEG', exif=exif
+        )
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_new_image_waits_for_processing(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'С картинкой', 'image': self.upload()}
+        )
+        post = Post.objects.get(text='С картинкой')
+        self.assertFalse(post.image_ready)
+        self.assertTrue(post.feed_entry.image_pending)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertTemplateUsed(
+            response, 'posts/includes/image_placeholder.html'
+        )
+
+        task = tasks.claim('test')
+        self.assertEqual(task.name, 'posts.images.process_image')
+        tasks.execute(task)
+        post.refresh_from_db()
+        self.assertTrue(post.image_ready)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertFalse(image.getexif())
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertTemplateNotUsed(
+            response, 'posts/includes/image_placeholder.html'
+        )
+        self.assertContains(response, '<img class="card-img-top"')
+        entry = FeedEntry.objects.get(pk=post.pk)
+        self.assertFalse(entry.image_pending)
+        self.assertTrue(entry.thumbnail_url.startswith('/media/cache/'))
+
+    def test_failed_processing_is_retried_then_published(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'С картинкой', 'image': self.upload()}
+        )
+        post = Post.objects.get(text='С картинкой')
+        with mock.patch.object(images, 'prepare_original',
+                               side_effect=OSError('хранилище недоступно')):
+            for attempt in range(1, 4):
+                task = tasks.claim('test')
+                self.assertEqual(task.attempts, attempt)
+                tasks.execute(task)
+                post.refresh_from_db()
+                # до последней попытки пост ждёт обработки под заглушкой
+                self.assertEqual(post.image_ready, attempt == 3)
+                Task.objects.update(run_at=task.run_at)
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+        entry = FeedEntry.objects.get(pk=post.pk)
+        self.assertFalse(entry.image_pending)
+        self.assertEqual(entry.thumbnail_url, '')
+
+    def test_post_page_does_not_build_thumbnails(self):
+        post = Post.objects.create(text='Текст', author=self.user,
+                                   image=self.upload())
+        FeedEntry.objects.filter(pk=post.pk).update(
+            thumbnail_url='/media/cache/stored.jpg'
+        )
+        cache.clear()
+        with mock.patch.object(thumbnails, 'get_thumbnail') as sorl:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            )
+            sorl.assert_not_called()
+        self.assertContains(response, '/media/cache/stored.jpg')
+
+    def test_warmed_urls_reach_other_processes(self):
+        post = Post.objects.create(text='Текст', author=self.user,
+                                   image=self.upload())
+        before = FeedEntry.objects.get(pk=post.pk)
+        self.assertEqual(before.thumbnail_url, '')
+        call_command('warm_thumbnails', workers=1, stdout=io.StringIO())
+        entry = FeedEntry.objects.get(pk=post.pk)
+        self.assertTrue(entry.thumbnail_url.startswith('/media/cache/'))
+        # карточки в кэше других процессов привязаны к updated
+        self.assertGreater(entry.updated, before.updated)
+        out = io.StringIO()
+        call_command('warm_thumbnails', workers=1, stdout=out)
+        self.assertIn('обновлено карточек: 0', out.getvalue())
+        # у web-процесса свой кэш адресов: адрес берётся из FeedEntry
+        cache.clear()
+        with mock.patch.object(thumbnails, 'get_thumbnail') as sorl:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            )
+            sorl.assert_not_called()
+        self.assertContains(response, entry.thumbnail_url)
+
+    def test_edit_without_new_image_keeps_it_ready(self):
+        post = Post.objects.create(text='Текст', author=self.user)
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Правка'}
+        )
+        post.refresh_from_db()
+        self.assertTrue(post.image_ready)
+
+    def test_saving_post_does_not_build_thumbnails(self):
+        cache.clear()
+        with mock.patch.object(thumbnails, 'get_thumbnail') as sorl:
+            post = Post.objects.create(text='Текст', author=self.user,
+                                       image=self.upload())
+            sorl.assert_not_called()
+        self.assertEqual(FeedEntry.objects.get(pk=post.pk).thumbnail_url, '')
+
+    def test_warmed_thumbnails_are_resolved_without_sorl(self):
+        cache.clear()
+        posts = [
+            Post.objects.create(text=str(ind), author=self.user,
+                                image=self.upload())
+            for ind in range(3)
+        ]
+        call_command('warm_thumbnails', workers=1, stdout=io.StringIO())
+        with mock.patch.object(thumbnails, 'get_thumbnail') as sorl:
+            thumbnails.resolve_thumbnails(posts)
+            sorl.assert_not_called()
+        for post in posts:
+            self.assertTrue(post.thumbnail_url.startswith('/media/cache/'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, posts[0].thumbnail_url)
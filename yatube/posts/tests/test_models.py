@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..counters import repair_counters
+from ..models import Comment, FeedEntry, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -53,3 +54,126 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.other_group = Group.objects.create(
+            title='Группа 2', slug='group-2', description='Описание'
+        )
+
+    def counters(self):
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        author = UserStats.objects.get(user=self.author)
+        reader = UserStats.objects.get(user=self.reader)
+        return (author.posts_count, author.followers_count,
+                reader.following_count, self.group.posts_count,
+                self.other_group.posts_count)
+
+    def test_counters_follow_writes(self):
+        """Счётчики обновляются при создании, правке и удалении."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.counters(), (1, 1, 1, 1, 0))
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(self.counters(), (1, 1, 1, 0, 1))
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        Follow.objects.all().delete()
+        post.delete()
+        self.assertEqual(self.counters(), (0, 0, 0, 0, 0))
+
+    def test_repair_counters_fixes_drift(self):
+        Post.objects.create(author=self.author, text='Пост', group=self.group)
+        UserStats.objects.filter(user=self.author).update(posts_count=5)
+        Group.objects.update(posts_count=3)
+        UserStats.objects.filter(user=self.reader).delete()
+        drift = repair_counters(dry_run=True)
+        self.assertEqual(drift['posts.UserStats.posts_count'], 1)
+        self.assertEqual(drift['posts.Group.posts_count'], 2)
+        repair_counters()
+        self.assertEqual(self.counters(), (1, 0, 0, 1, 0))
+        self.assertFalse(any(repair_counters(dry_run=True).values()))
+
+
+class FeedEntryTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, text='Пост ' * 500, group=self.group
+        )
+
+    def entry(self):
+        return FeedEntry.objects.get(pk=self.post.pk)
+
+    def test_entry_copies_card_fields(self):
+        entry = self.entry()
+        self.assertEqual(
+            (entry.author_id, entry.author_username, entry.author_name,
+             entry.group_id, entry.group_slug, entry.group_title),
+            (self.author.pk, 'author', 'Лев Толстой',
+             self.group.pk, 'group', 'Группа')
+        )
+        self.assertEqual(len(entry.text), 1000)
+        self.assertTrue(entry.text.endswith('…'))
+        self.assertEqual(entry.pub_date, self.post.pub_date)
+
+    def test_entry_follows_writes(self):
+        self.post.text = 'Правка'
+        self.post.group = None
+        self.post.save()
+        self.assertEqual(
+            (self.entry().text, self.entry().group_slug), ('Правка', '')
+        )
+        self.post.group = self.group
+        self.post.save()
+        comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Ком'
+        )
+        self.assertEqual(self.entry().comments_count, 1)
+        comment.delete()
+        self.assertEqual(self.entry().comments_count, 0)
+
+        self.author.first_name = 'Алексей'
+        self.author.save()
+        self.assertEqual(self.entry().author_name, 'Алексей Толстой')
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertEqual(self.entry().group_slug, 'renamed')
+        self.group.delete()
+        entry = self.entry()
+        self.assertEqual((entry.group_id, entry.group_slug), (None, ''))
+
+        self.post.delete()
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_bulk_create_builds_entries(self):
+        Post.objects.bulk_create([
+            Post(author=self.author, text=f'Пачка {ind}') for ind in range(3)
+        ])
+        self.assertEqual(FeedEntry.objects.count(), 4)
+        Post.objects.bulk_create(
+            [Post(author=self.author, text='Без записи')], sync_entries=False
+        )
+        self.assertEqual(FeedEntry.objects.count(), 4)
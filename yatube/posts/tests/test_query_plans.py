@@ -0,0 +1,130 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import feeds, search
+from ..models import Comment, Follow, Group, Post, UserStats
+from ..utils import encode_cursor
+from .utils import QueryPlanMixin
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTest(QueryPlanMixin, TestCase):
+    """Запросы страниц не деградируют до полного прохода по таблице
+    и сортировки во временном B-дереве."""
+
+    # результаты поиска упорядочены по bm25, индекса по нему нет
+    allowed_sorts = (search.FTS_TABLE,)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Title', slug='slug', description='Description'
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        for ind in range(3):
+            self.post = Post.objects.create(
+                author=self.author, text=f'Текст {ind}', group=self.group
+            )
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Ком'
+            )
+        self.client.force_login(self.user)
+
+    def read_urls(self):
+        post_id = {'post_id': self.post.pk}
+        return [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_posts', kwargs={'slug': 'slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs=post_id),
+            reverse('posts:post_comments', kwargs=post_id),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs=post_id),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Текст',
+            reverse('about:author'),
+            reverse('about:tech'),
+        ]
+
+    def test_read_views_use_indexes(self):
+        for url in self.read_urls():
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertIndexedPlans('get', url)
+
+    def test_cursor_pages_use_indexes(self):
+        with override_settings(POSTS_PAGINATION={
+            'posts:index': 'cursor',
+            'posts:group_posts': 'cursor',
+            'posts:profile': 'cursor',
+            'posts:follow_index': 'cursor',
+        }):
+            for name, kwargs in (
+                ('posts:index', {}),
+                ('posts:group_posts', {'slug': 'slug'}),
+                ('posts:profile', {'username': 'author'}),
+                ('posts:follow_index', {}),
+            ):
+                cache.clear()
+                response = self.client.get(reverse(name, kwargs=kwargs))
+                cursor = response.context['page_obj'].next_cursor or ''
+                url = reverse(name, kwargs=kwargs) + f'?cursor={cursor}'
+                with self.subTest(url=url):
+                    cache.clear()
+                    self.assertIndexedPlans('get', url)
+
+    @override_settings(FOLLOW_FEED_FANOUT_LIMIT=1)
+    def test_pulled_follow_feed_uses_indexes(self):
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.user, author=other)
+        UserStats.objects.filter(user=other).update(feed_pull=False)
+        Post.objects.create(author=other, text='Разложенный')
+        feeds.follower_added(self.author.pk)
+        self.assertEqual(
+            feeds.pull_authors({self.author.pk, other.pk}), {self.author.pk}
+        )
+        url = reverse('posts:follow_index')
+        self.assertEqual(len(self.client.get(url).context['page_obj']), 4)
+        cursor = encode_cursor(
+            'n', [self.post.pub_date.isoformat(), self.post.pk]
+        )
+        for page_url in (url, f'{url}?cursor={cursor}'):
+            with self.subTest(url=page_url):
+                self.assertIndexedPlans('get', page_url)
+
+    def test_full_index_scans_are_problems(self):
+        posts = Post.objects.order_by('-pub_date', '-id')
+        self.assertFalse(self.plan_problems(str(posts[:10].query)))
+        scan = str(posts.filter(comments_count__gt=0).query)
+        self.assertTrue(any(
+            'USING INDEX' in step for step in self.plan_problems(scan)
+        ))
+
+    def test_write_views_use_indexes(self):
+        post_id = {'post_id': self.post.pk}
+        writes = [
+            (reverse('posts:post_create'),
+             {'text': 'Новый', 'group': self.group.pk}),
+            (reverse('posts:post_edit', kwargs=post_id),
+             {'text': 'Правка', 'group': ''}),
+            (reverse('posts:add_comment', kwargs=post_id),
+             {'text': 'Ком'}),
+            (reverse('posts:profile_unfollow',
+                     kwargs={'username': 'author'}), None),
+            (reverse('posts:profile_follow',
+                     kwargs={'username': 'author'}), None),
+        ]
+        for url, data in writes:
+            with self.subTest(url=url):
+                method = 'post' if data is not None else 'get'
+                self.assertIndexedPlans(method, url, data=data or {})
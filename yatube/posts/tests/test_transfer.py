@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+from freezegun import freeze_time
+
+from .. import transfer
+from ..models import (Comment, FeedEntry, Follow, FollowFeedItem, Group,
+                      Post, UserStats)
+
+User = get_user_model()
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.author = User.objects.create_user(
+            username='author', first_name='Лев', password='secret'
+        )
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        with freeze_time('2020-05-01 10:00:00'):
+            self.posts = [
+                Post.objects.create(author=self.author, text='Море и ветер',
+                                    group=self.group),
+                Post.objects.create(author=self.author, text='Без группы'),
+                Post.objects.create(author=self.reader, text='Читатель'),
+            ]
+            Comment.objects.create(post=self.posts[0], author=self.reader,
+                                   text='Комментарий, "в кавычках"\nи строки')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def wipe(self):
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertFalse(Post.objects.exists())
+
+    def assertRestored(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        self.assertEqual(post.text, 'Море и ветер')
+        self.assertEqual(post.group.slug, 'group')
+        self.assertEqual(
+            post.pub_date, datetime(2020, 5, 1, 10, tzinfo=timezone.utc)
+        )
+        self.assertIsNone(Post.objects.get(pk=self.posts[1].pk).group)
+        self.assertEqual(
+            Comment.objects.get().text, 'Комментарий, "в кавычках"\nи строки'
+        )
+        author = User.objects.get(username='author')
+        self.assertTrue(author.check_password('secret'))
+        self.assertEqual(UserStats.objects.for_user(author).posts_count, 2)
+        self.assertEqual(
+            UserStats.objects.for_user(author).followers_count, 1
+        )
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+        self.assertEqual(FeedEntry.objects.count(), 3)
+        self.assertEqual(
+            FollowFeedItem.objects.filter(user__username='reader').count(), 2
+        )
+        response = self.client.get(reverse('posts:search'), {'q': 'море'})
+        self.assertContains(response, 'Море и ветер')
+
+    def test_ndjson_round_trip(self):
+        path = self.path('dump.ndjson.gz')
+        call_command('export_data', path, stdout=StringIO())
+        self.wipe()
+        call_command('import_data', path, stdout=StringIO())
+        self.assertRestored()
+
+    def test_csv_round_trip(self):
+        path = self.path('dump')
+        call_command('export_data', path, format='csv', stdout=StringIO())
+        self.assertEqual(
+            sorted(os.listdir(path)),
+            sorted(f'{name}.csv' for name in transfer.MODELS)
+        )
+        self.wipe()
+        call_command('import_data', path, stdout=StringIO())
+        self.assertRestored()
+
+    def test_resume_from_checkpoint(self):
+        path = self.path('dump.ndjson')
+        call_command('export_data', path, stdout=StringIO())
+        with open(path, encoding='utf-8') as file:
+            lines = file.readlines()
+        broken = self.path('broken.ndjson')
+        with open(broken, 'w', encoding='utf-8') as file:
+            for line in lines:
+                row = json.loads(line)
+                if row['model'] == 'posts' and row['id'] == self.posts[2].pk:
+                    row['colour'] = 'red'
+                file.write(json.dumps(row) + '\n')
+        self.wipe()
+        checkpoint = self.path('checkpoint.json')
+        with self.assertRaisesMessage(CommandError, 'colour'):
+            call_command('import_data', broken, batch_size=1,
+                         checkpoint=checkpoint, stdout=StringIO())
+        with open(checkpoint, encoding='utf-8') as file:
+            self.assertEqual(json.load(file)['posts'], 2)
+        # уже загруженное не читается заново: удалённый пост не вернётся
+        Post.objects.filter(pk=self.posts[1].pk).delete()
+        call_command('import_data', path, batch_size=1,
+                     checkpoint=checkpoint, stdout=StringIO())
+        self.assertEqual(
+            sorted(Post.objects.values_list('pk', flat=True)),
+            [self.posts[0].pk, self.posts[2].pk]
+        )
+
+    def test_unknown_models_are_rejected(self):
+        with self.assertRaisesMessage(CommandError, 'likes'):
+            call_command('export_data', self.path('dump.ndjson'),
+                         models='posts,likes', stdout=StringIO())
+
+    def test_repeated_import_skips_identical_rows(self):
+        for name, data_format in (('dump.ndjson', 'ndjson'),
+                                  ('dump', 'csv')):
+            with self.subTest(format=data_format):
+                path = self.path(name)
+                call_command('export_data', path, format=data_format,
+                             stdout=StringIO())
+                out = StringIO()
+                call_command('import_data', path, stdout=out)
+                self.assertIn('posts: уже были в базе и пропущены: 3',
+                              out.getvalue())
+                self.assertEqual(Post.objects.count(), 3)
+
+    def test_colliding_rows_stop_import(self):
+        path = self.path('dump.ndjson')
+        call_command('export_data', path, stdout=StringIO())
+        User.objects.filter(pk=self.author.pk).update(first_name='Другой')
+        with self.assertRaisesMessage(CommandError, 'users: id уже заняты'):
+            call_command('import_data', path, stdout=StringIO())
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).first_name, 'Другой'
+        )
+
+        self.wipe()
+        stranger = User.objects.create_user(username='author')
+        with self.assertRaisesMessage(CommandError, 'users'):
+            call_command('import_data', path, stdout=StringIO())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(stranger.posts.exists())
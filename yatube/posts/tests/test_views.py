@@ -1,13 +1,27 @@
+import csv
+import gzip
+import json
 from http import HTTPStatus
+from unittest import mock
 
 from django import forms
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from freezegun import freeze_time
 
-from ..models import Group, Post, Follow
+from core import tasks
+from core.models import Task
+
+from .. import cache as posts_cache, feeds, follows, search
+from ..models import (Comment, FeedEntry, Group, Post, Follow,
+                      FollowFeedItem)
+from ..utils import CNT_COMMENTS
+from .utils import QueryBudgetMixin
 
 User = get_user_model()
 
@@ -182,6 +196,68 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']), 3)
 
 
+@override_settings(POSTS_PAGINATION={
+    'posts:index': 'cursor',
+    'posts:group_posts': 'cursor',
+    'posts:profile': 'cursor',
+})
+class CursorPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Title',
+            slug='Slug',
+            description='Description'
+        )
+        posts = [
+            Post(text=f'text_{ind}', author=cls.user, group=cls.group)
+            for ind in range(13)
+        ]
+        # одинаковое время публикации проверяет разбор «ничьих» по id
+        with freeze_time("2022-01-01 00:00:00"):
+            Post.objects.bulk_create(posts)
+        cls.reverses = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'Slug'}),
+            reverse('posts:profile', kwargs={'username': 'HasNoName'})
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        for rev in self.reverses:
+            with self.subTest(rev=rev):
+                first = self.client.get(rev).context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    rev, {'cursor': first.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertFalse(
+                    {p.pk for p in first} & {p.pk for p in second}
+                )
+                back = self.client.get(
+                    rev, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    [p.pk for p in back], [p.pk for p in first]
+                )
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertNotContains(response, 'Последняя')
+
+
 class CacheTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -203,6 +279,154 @@ class CacheTest(TestCase):
             response = self.client.get(reverse('posts:index'))
             self.assertNotContains(response, post.text)
 
+    def test_shared_page_cache_is_personalized(self):
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='Test post', author=author)
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': post.pk})
+        author_client = Client()
+        author_client.force_login(author)
+        self.assertContains(author_client.get(reverse('posts:index')),
+                            edit_url)
+        self.assertNotContains(self.client.get(reverse('posts:index')),
+                               edit_url)
+        self.assertContains(author_client.get(reverse('posts:index')),
+                            edit_url)
+
+    def test_writes_invalidate_cached_pages(self):
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='First post', author=author)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        ]
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(text='Second post', author=author)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Second post')
+
+
+class VersionedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Title', slug='slug', description='Description'
+        )
+        self.post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group
+        )
+
+    def versions(self):
+        return posts_cache.get_versions(
+            posts_cache.FEED,
+            (posts_cache.GROUP, self.group.pk),
+            (posts_cache.AUTHOR, self.author.pk),
+            (posts_cache.POST, self.post.pk),
+            posts_cache.SITE,
+        )
+
+    def changed(self, action):
+        before = self.versions()
+        action()
+        return [old != new for old, new in zip(before, self.versions())]
+
+    def test_writes_bump_only_their_scopes(self):
+        self.assertEqual(
+            self.changed(lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Ком'
+            )),
+            [False, False, False, True, False]
+        )
+        self.assertEqual(
+            self.changed(lambda: Post.objects.create(
+                text='Другой', author=self.author
+            )),
+            [True, False, True, False, False]
+        )
+        self.assertEqual(
+            self.changed(lambda: self.post.save()),
+            [True, True, True, True, False]
+        )
+
+    def test_renames_bump_site_version(self):
+        self.client.get(reverse('posts:index'))
+
+        def rename():
+            self.author.first_name = 'Лев'
+            self.author.save()
+        self.assertEqual(
+            self.changed(rename), [False, False, False, False, True]
+        )
+        self.assertContains(self.client.get(reverse('posts:index')), 'Лев')
+        self.assertEqual(
+            self.changed(lambda: self.author.save(
+                update_fields=['last_login']
+            )),
+            [False] * 5
+        )
+
+    @override_settings(POSTS_CACHE_TIMEOUT=60 * 60,
+                       POSTS_LOCAL_CACHE_TIMEOUT=60)
+    def test_process_local_cache_keeps_versions_short(self):
+        # версии, поднятые другим воркером, сюда не доходят: локальные
+        # версии должны истечь, чтобы страницы и ETag обновились
+        self.assertEqual(posts_cache.cache_timeout(), 60)
+        with freeze_time('2030-01-01 10:00:00') as frozen:
+            cache.clear()
+            before = self.versions()
+            frozen.tick(30)
+            self.assertEqual(self.versions(), before)
+            frozen.tick(31)
+            self.assertTrue(all(
+                old != new for old, new in zip(before, self.versions())
+            ))
+        dummy = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+        }}
+        with self.settings(CACHES=dummy):
+            self.assertEqual(posts_cache.cache_timeout(), 60 * 60)
+            self.assertIsNone(posts_cache.version_timeout())
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Текст', author=self.author)
+        self.comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий'
+        )
+        self.index = reverse('posts:index')
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_cards_are_rendered_once_until_post_changes(self):
+        self.assertTemplateUsed(self.client.get(self.index),
+                                'includes/card.html')
+        posts_cache.bump(posts_cache.FEED)
+        response = self.client.get(self.index)
+        self.assertTemplateUsed(response, 'posts/includes/post_list.html')
+        self.assertTemplateNotUsed(response, 'includes/card.html')
+        with freeze_time('2030-01-01'):
+            self.post.text = 'Новый текст'
+            self.post.save()
+        response = self.client.get(self.index)
+        self.assertTemplateUsed(response, 'includes/card.html')
+        self.assertContains(response, 'Новый текст')
+
+    def test_comment_blocks_are_cached(self):
+        self.assertTemplateUsed(self.client.get(self.detail),
+                                'posts/includes/comment.html')
+        response = self.client.get(self.detail)
+        self.assertTemplateNotUsed(response, 'posts/includes/comment.html')
+        self.assertContains(response, 'Комментарий')
+        self.comment.text = 'Исправлено'
+        self.comment.save()
+        self.assertContains(self.client.get(self.detail), 'Исправлено')
+
 
 class FollowTestCase(TestCase):
     def setUp(self):
@@ -276,3 +500,593 @@ class FollowTestCase(TestCase):
         self.client.force_login(self.user)
         response = self.client.get(reverse('posts:follow_index'))
         self.assertNotContains(response, post_from_unfollowed_user.text)
+
+
+class FollowFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        self.old_post = Post.objects.create(author=self.author, text='old')
+        self.client.force_login(self.reader)
+
+    def feed_texts(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertTrue(FollowFeedItem.objects.filter(
+            user=self.reader, post=self.old_post
+        ).exists())
+        Post.objects.create(author=self.author, text='new')
+        self.assertEqual(
+            FollowFeedItem.objects.filter(user=self.reader).count(), 2
+        )
+        self.assertEqual(self.feed_texts(), ['new', 'old'])
+
+    def test_unfollow_prunes_feed(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(
+            FollowFeedItem.objects.filter(user=self.reader).exists()
+        )
+        self.assertEqual(self.feed_texts(), [])
+
+    @override_settings(FOLLOW_FEED_FANOUT_LIMIT=1)
+    def test_popular_author_posts_are_read_on_demand(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        cache.clear()
+        Post.objects.create(author=self.author, text='pulled')
+        self.assertFalse(FollowFeedItem.objects.filter(
+            post__text='pulled'
+        ).exists())
+        self.assertEqual(self.feed_texts(), ['pulled', 'old'])
+
+    @override_settings(FOLLOW_FEED_FANOUT_LIMIT=2)
+    def test_no_posts_lost_when_author_crosses_limit(self):
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(author=self.author, text='pushed')
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(author=self.author, text='pulled')
+        self.assertEqual(feeds.pull_authors({self.author.pk}),
+                         {self.author.pk})
+        expected = ['pulled', 'pushed', 'old']
+        self.assertEqual(self.feed_texts(), expected)
+
+        Follow.objects.filter(user=other).delete()
+        # пока задача раздачи ждёт воркера, посты подмешиваются
+        self.assertEqual(self.feed_texts(), expected)
+        task = tasks.claim('test')
+        self.assertEqual(task.name, feeds.materialize_author.name)
+        tasks.execute(task)
+        self.assertEqual(feeds.pull_authors({self.author.pk}), set())
+        self.assertEqual(
+            FollowFeedItem.objects.filter(user=self.reader).count(), 3
+        )
+        self.assertEqual(self.feed_texts(), expected)
+
+        Post.objects.create(author=self.author, text='pushed again')
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(author=self.author, text='pulled again')
+        self.assertEqual(self.feed_texts(), ['pulled again', 'pushed again',
+                                             *expected])
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader')
+        self.authors = [
+            User.objects.create_user(username=f'author{ind}')
+            for ind in range(3)
+        ]
+        self.client.force_login(self.reader)
+
+    def test_followed_ids_are_cached_until_follows_change(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.assertEqual(follows.followed_ids(self.reader),
+                         {self.authors[0].pk})
+        with self.assertNumQueries(0):
+            ids = follows.followed_ids(self.reader)
+            self.assertTrue(all(
+                author.pk not in ids for author in self.authors[1:]
+            ))
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': 'author1'}))
+        self.assertEqual(follows.followed_ids(self.reader),
+                         {self.authors[0].pk, self.authors[1].pk})
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': 'author0'}))
+        self.assertEqual(follows.followed_ids(self.reader),
+                         {self.authors[1].pk})
+
+    def test_graph_is_loaded_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.reader
+        Follow.objects.create(user=self.reader, author=self.authors[2])
+        self.assertIn(self.authors[2].pk, follows.following(request))
+        with self.assertNumQueries(0):
+            self.assertIn(self.authors[2].pk, follows.following(request))
+        request.user = AnonymousUser()
+        self.assertEqual(follows.followed_ids(request.user), frozenset())
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Число запросов не зависит от числа постов и комментариев."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader')
+        # профиль, на котором проверяется N+1: его постов становится больше
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Title', slug='slug', description='Description'
+        )
+        self.client.force_login(self.user)
+        self.budgets = {}
+
+    def add_posts(self, count):
+        authors = [
+            User.objects.create_user(username=f'author_{ind}_{count}')
+            for ind in range(count)
+        ]
+        for author in authors:
+            Follow.objects.create(user=self.user, author=author)
+            post = Post.objects.create(
+                author=author, text='Текст', group=self.group
+            )
+            Comment.objects.create(post=post, author=author, text='Ком')
+            Post.objects.create(
+                author=self.author, text='Текст', group=self.group
+            )
+        return post
+
+    def urls(self, post):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+
+    def test_query_count_is_constant(self):
+        post = self.add_posts(2)
+        budgets = {}
+        for url in self.urls(post):
+            cache.clear()
+            budgets[url] = self.count_queries(url)
+        post = self.add_posts(12)
+        for _ in range(5):
+            Comment.objects.create(post=post, author=self.user, text='Ком')
+        for url, budget in zip(self.urls(post), budgets.values()):
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertQueryBudget(url, budget)
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class PageLookupsTest(QueryBudgetMixin, TestCase):
+    """Независимые данные страницы приходят одним запросом с главным
+    объектом: сессия, пользователь и сам объект, кэш лент прогрет."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.author, text='Текст')
+        Comment.objects.create(post=self.post, author=self.reader, text='К')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+
+    def test_profile_is_one_query(self):
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.client.get(url)
+        self.assertQueryBudget(url, 3)
+        response = self.client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['stats'].followers_count, 1)
+
+    def test_post_detail_loads_author_stats_with_post(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        self.assertQueryBudget(url, 4)
+        self.assertEqual(
+            self.client.get(url).context['cnt_posts_user'], 1
+        )
+
+
+class CommentPagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=author, text='Текст')
+        with freeze_time('2022-01-01 00:00:00'):
+            for ind in range(CNT_COMMENTS + 5):
+                Comment.objects.create(
+                    post=self.post, author=author, text=f'Ком_{ind}'
+                )
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.pk})
+        self.fragment_url = reverse('posts:post_comments',
+                                    kwargs={'post_id': self.post.pk})
+
+    def test_first_page_is_embedded(self):
+        response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'Ком_{ind}' for ind in range(CNT_COMMENTS)]
+        )
+        self.assertNotContains(response, f'Ком_{CNT_COMMENTS}<')
+        self.assertContains(
+            response, f'{self.fragment_url}?cursor={comments.next_cursor}'
+        )
+
+    def test_fragment_continues_after_cursor(self):
+        cursor = self.client.get(self.url).context['comments'].next_cursor
+        response = self.client.get(self.fragment_url, {'cursor': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertContains(response, f'Ком_{CNT_COMMENTS}<')
+        self.assertNotContains(response, 'Ком_0<')
+        self.assertNotContains(response, 'data-comments-url')
+
+        data = self.client.get(
+            self.fragment_url, {'cursor': cursor, 'format': 'json'}
+        ).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            [f'Ком_{ind}' for ind in range(CNT_COMMENTS, CNT_COMMENTS + 5)]
+        )
+        self.assertIsNone(data['next_cursor'])
+
+    def test_missing_post_fragment_is_not_found(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 999})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Title', slug='slug', description='Description'
+        )
+        self.post = Post.objects.create(
+            text='Текст', author=self.author, group=self.group
+        )
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+        self.profile = reverse(
+            'posts:profile', kwargs={'username': 'author'}
+        )
+        self.group_page = reverse(
+            'posts:group_posts', kwargs={'slug': 'slug'}
+        )
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+
+    def test_unchanged_pages_are_not_rendered(self):
+        for url in (self.detail, self.profile, self.group_page):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with self.assertNumQueries(0):
+                    again = self.revalidate(url, response)
+                self.assertEqual(again.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_writes_change_etags(self):
+        writes = (
+            (self.detail, lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Ком'
+            )),
+            (self.group_page, lambda: Post.objects.create(
+                text='Ещё', author=self.reader, group=self.group
+            )),
+            (self.profile, lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            )),
+            (self.detail, lambda: Post.objects.create(
+                text='Новый', author=self.author
+            )),
+        )
+        for url, write in writes:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                write()
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, HTTPStatus.OK
+                )
+
+    def test_last_modified_for_anonymous_only(self):
+        with freeze_time('2030-01-01 12:00:00'):
+            posts_cache.bump((posts_cache.POST, self.post.pk),
+                             (posts_cache.AUTHOR, self.author.pk),
+                             posts_cache.SITE)
+        with freeze_time('2030-01-01 12:00:05'):
+            response = self.client.get(self.detail)
+            since = response['Last-Modified']
+            self.assertEqual(since, 'Tue, 01 Jan 2030 12:00:00 GMT')
+            self.assertEqual(
+                self.client.get(
+                    self.detail, HTTP_IF_MODIFIED_SINCE=since
+                ).status_code,
+                HTTPStatus.NOT_MODIFIED
+            )
+        with freeze_time('2030-01-01 12:00:10'):
+            self.post.text = 'Правка'
+            self.post.save()
+            self.assertContains(
+                self.client.get(self.detail, HTTP_IF_MODIFIED_SINCE=since),
+                'Правка'
+            )
+        self.client.force_login(self.reader)
+        response = self.client.get(self.detail)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_etag_depends_on_viewer(self):
+        anonymous = self.client.get(self.profile)
+        self.client.force_login(self.reader)
+        response = self.revalidate(self.profile, anonymous)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Подписаться')
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        self.assertContains(self.revalidate(self.profile, response),
+                            'Отписаться')
+
+    def test_missing_objects(self):
+        for url in (
+            reverse('posts:post_detail', kwargs={'post_id': 999}),
+            reverse('posts:profile', kwargs={'username': 'missing'}),
+            reverse('posts:group_posts', kwargs={'slug': 'missing'}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.NOT_FOUND)
+        response = self.client.get(self.detail)
+        self.post.delete()
+        self.assertEqual(self.revalidate(self.detail, response).status_code,
+                         HTTPStatus.NOT_FOUND)
+
+
+class FeedEntryViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        group = Group.objects.create(
+            title='Title', slug='slug', description='Description'
+        )
+        Post.objects.create(author=author, text='Текст', group=group)
+
+    def test_feeds_read_only_entries(self):
+        """Ленты читают одну таблицу FeedEntry без соединений."""
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_posts', kwargs={'slug': 'slug'}),
+                    reverse('posts:profile', kwargs={'username': 'author'})):
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertContains(response, 'Текст')
+                feed_queries = [
+                    query['sql'] for query in context.captured_queries
+                    if 'posts_feedentry' in query['sql']
+                ]
+                self.assertTrue(feed_queries)
+                for sql in feed_queries:
+                    self.assertNotIn('JOIN', sql)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='tolstoy', first_name='Лев', last_name='Толстой'
+        )
+        self.group = Group.objects.create(
+            title='Классика', slug='classic', description='Описание'
+        )
+        self.post = Post.objects.create(
+            text='Все счастливые семьи похожи друг на друга',
+            author=self.author,
+            group=self.group
+        )
+        self.url = reverse('posts:search')
+
+    def found(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        return response, [post.pk for post in response.context['page_obj']]
+
+    def test_search_by_text_group_and_author(self):
+        self.assertTrue(search.available())
+        for query in ('счастливые', 'СЕМЬ', 'классика', 'Толстой'):
+            with self.subTest(query=query):
+                self.assertEqual(self.found(query)[1], [self.post.pk])
+        self.assertEqual(self.found('анна')[1], [])
+        self.assertEqual(self.found('"OR*(')[1], [])
+
+    def test_index_follows_writes(self):
+        self.post.text = 'Анна Каренина'
+        self.post.save()
+        self.assertEqual(self.found('анна')[1], [self.post.pk])
+        self.assertEqual(self.found('счастливые')[1], [])
+        self.group.title = 'Романы'
+        self.group.save()
+        tasks.execute(tasks.claim('test'))
+        self.assertEqual(self.found('романы')[1], [self.post.pk])
+        self.post.delete()
+        self.assertEqual(self.found('анна')[1], [])
+
+    def test_author_rename_is_reindexed_in_background(self):
+        site = (posts_cache.SITE,)
+        before = posts_cache.get_versions(*site)
+        self.author.set_password('new-secret')
+        self.author.save()
+        self.assertEqual(posts_cache.get_versions(*site), before)
+        self.assertFalse(Task.objects.exists())
+
+        self.author.last_name = 'Николаевич'
+        self.author.save()
+        self.assertNotEqual(posts_cache.get_versions(*site), before)
+        self.assertEqual(self.found('николаевич')[1], [])
+        tasks.execute(tasks.claim('test'))
+        self.assertEqual(self.found('николаевич')[1], [self.post.pk])
+
+    def test_group_edits_touch_cards_only_when_they_change(self):
+        site = (posts_cache.SITE,)
+        before = posts_cache.get_versions(*site)
+        self.group.description = 'Другое описание'
+        self.group.save()
+        self.assertEqual(posts_cache.get_versions(*site), before)
+        self.assertFalse(Task.objects.exists())
+
+        self.group.slug = 'novels'
+        self.group.save()
+        self.assertNotEqual(posts_cache.get_versions(*site), before)
+        self.assertEqual(
+            FeedEntry.objects.get(pk=self.post.pk).group_slug, 'novels'
+        )
+        self.assertFalse(Task.objects.exists())
+
+        self.group.title = 'Романы'
+        self.group.save(update_fields=['title'])
+        self.assertEqual(self.found('романы')[1], [])
+        tasks.execute(tasks.claim('test'))
+        self.assertEqual(self.found('романы')[1], [self.post.pk])
+
+    def test_search_works_without_fts5(self):
+        self.addCleanup(setattr, search, '_available', None)
+        with connection.cursor() as cursor:
+            cursor.execute(search.DROP_SQL)
+        no_fts5 = (f'CREATE VIRTUAL TABLE {search.FTS_TABLE} '
+                   'USING no_such_module(text)')
+        with mock.patch.object(search, 'CREATE_SQL', no_fts5):
+            self.assertEqual(search.rebuild(), 0)
+        self.assertFalse(search.available())
+        post = Post.objects.create(text='Анна Каренина', author=self.author)
+        self.assertEqual(self.found('Карен')[1], [post.pk])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@test.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'семьи'}
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['cl'].result_list],
+            [self.post.pk]
+        )
+
+    def test_search_pages_by_cursor(self):
+        Post.objects.bulk_create([
+            Post(text=f'война и мир {ind}', author=self.author)
+            for ind in range(12)
+        ])
+        search.rebuild(batch_size=5)
+        response, first = self.found('война')
+        self.assertEqual(len(first), 10)
+        cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'q=%D0%B2%D0%BE%D0%B9%D0%BD%D0%B0'
+                                      f'&cursor={cursor}')
+        _, second = self.found('война', cursor=cursor)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+
+
+class ProfileExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='other')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {ind}',
+                                group=self.group if ind else None)
+            for ind in range(3)
+        ]
+        Post.objects.create(author=self.other, text='Чужой пост')
+        Comment.objects.create(post=self.posts[0], author=self.author,
+                               text='Мой, "в кавычках"\nкомментарий')
+        Comment.objects.create(post=self.posts[0], author=self.other,
+                               text='Чужой комментарий')
+        self.url = reverse('posts:profile_export',
+                           kwargs={'username': 'author'})
+        self.client.force_login(self.author)
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_export(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        self.assertIn('author-history.ndjson',
+                      response['Content-Disposition'])
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [('post', post.pk) for post in self.posts]
+            + [('comment', Comment.objects.get(author=self.author).pk)]
+        )
+        self.assertEqual(rows[1]['group'], 'group')
+        self.assertEqual(rows[-1]['text'], 'Мой, "в кавычках"\nкомментарий')
+
+    def test_csv_export(self):
+        response, body = self.download(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(body.decode().splitlines(True)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1]['text'], 'Мой, "в кавычках"\nкомментарий')
+        self.assertEqual(rows[-1]['post_id'], str(self.posts[0].pk))
+
+    def test_gzip_on_the_fly(self):
+        _, plain = self.download()
+        response, body = self.download(gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(body), plain)
+
+    def test_only_own_history(self):
+        self.assertRedirects(
+            self.client.get(reverse('posts:profile_export',
+                                    kwargs={'username': 'other'})),
+            reverse('posts:profile', kwargs={'username': 'other'})
+        )
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'})
+                         .status_code, HTTPStatus.BAD_REQUEST)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code,
+                         HTTPStatus.FOUND)
+
+    @override_settings(POSTS_EXPORT_RATE_LIMIT=(2, 3600))
+    def test_rate_limit(self):
+        for _ in range(2):
+            self.download()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
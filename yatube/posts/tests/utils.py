@@ -0,0 +1,80 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов на страницу."""
+
+    def count_queries(self, url, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as context:
+            client.get(url)
+        return len(context.captured_queries)
+
+    def assertQueryBudget(self, url, budget, client=None):
+        """Страница укладывается ровно в budget запросов."""
+        queries = self.count_queries(url, client)
+        self.assertEqual(
+            queries, budget,
+            f'{url}: {queries} запросов вместо {budget}'
+        )
+
+
+class QueryPlanMixin:
+    """Проверки планов SQL-запросов страниц (только SQLite)."""
+
+    # допустимые сортировки во временном B-дереве: подстроки запросов,
+    # где порядок по вычисляемому значению неизбежен
+    allowed_sorts = ()
+
+    def capture(self, method, url, client=None, **kwargs):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as context:
+            getattr(client, method)(url, **kwargs)
+        return [query['sql'] for query in context.captured_queries]
+
+    def explain(self, sql):
+        """Шаги плана: (id, id родителя, описание)."""
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [(row[0], row[1], row[-1]) for row in cursor.fetchall()]
+
+    def plan_problems(self, sql):
+        """Полные проходы по таблице и сортировки без индекса в плане.
+
+        SCAN по индексу допустим, только если это внешний цикл запроса
+        с LIMIT: тогда индекс задаёт порядок, а LIMIT обрывает чтение.
+        Проход по индексу без LIMIT или во вложенном цикле читает всю
+        таблицу так же, как и проход без индекса.
+        """
+        if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE',
+                                                'DELETE')):
+            return []
+        # запрос без WHERE и LIMIT читает всю таблицу намеренно
+        # (список групп в форме), проход по ней тогда не деградация
+        whole_table = ' WHERE ' not in sql and ' LIMIT ' not in sql
+        limited = ' LIMIT ' in sql
+        problems = []
+        loops = set()
+        for _, parent, step in self.explain(sql):
+            outer = parent not in loops
+            if step.startswith(('SCAN', 'SEARCH')):
+                loops.add(parent)
+            if (step.startswith('SCAN')
+                    and 'VIRTUAL TABLE INDEX' not in step
+                    and not whole_table
+                    and not (' USING ' in step and outer and limited)):
+                problems.append(step)
+            elif 'TEMP B-TREE' in step and not any(
+                allowed in sql for allowed in self.allowed_sorts
+            ):
+                problems.append(step)
+        return problems
+
+    def assertIndexedPlans(self, method, url, client=None, **kwargs):
+        """Все запросы страницы читают таблицы по индексу."""
+        for sql in self.capture(method, url, client, **kwargs):
+            problems = self.plan_problems(sql)
+            self.assertFalse(
+                problems, f'{method.upper()} {url}: {problems}\n{sql}'
+            )
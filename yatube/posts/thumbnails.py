@@ -0,0 +1,76 @@
+"""Пакетное получение адресов миниатюр для страницы постов.
+
+{% thumbnail %} на каждой карточке отдельно ходит в key-value хранилище
+sorl (а при промахе — в файловую систему). Здесь адреса всей страницы
+читаются одним get_many из кэша. В запросах страниц промахи не идут в
+sorl: адрес миниатюры карточки берётся из записи ленты (FeedEntry),
+куда его пишут обработка картинки и warm_thumbnails.
+"""
+import hashlib
+
+from django.core.cache import cache
+from sorl.thumbnail import get_thumbnail
+
+from .models import FeedEntry
+
+# миниатюра карточки и страницы поста
+CARD_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+# все размеры, которые используют шаблоны
+THUMBNAIL_SIZES = (CARD_THUMBNAIL,)
+
+URL_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def url_key(name, spec=CARD_THUMBNAIL):
+    geometry, options = spec
+    raw = f'{name}:{geometry}:{sorted(options.items())}'
+    return 'posts:thumb:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def thumbnail_url(image, spec=CARD_THUMBNAIL):
+    geometry, options = spec
+    return get_thumbnail(image, geometry, **options).url
+
+
+def stored_urls(post_ids):
+    """Адреса миниатюр карточек, сохранённые в записях лент."""
+    return dict(FeedEntry.objects.filter(
+        pk__in=post_ids
+    ).exclude(thumbnail_url='').values_list('pk', 'thumbnail_url'))
+
+
+def resolve_thumbnails(posts, spec=CARD_THUMBNAIL, generate=True):
+    """Проставляет post.thumbnail_url всем постам с готовой картинкой.
+
+    С generate=False картинка не читается и не ресайзится: промахи кэша
+    берут адрес из записи ленты, а если его нет — получают пустой.
+    """
+    # у FeedEntry адрес миниатюры уже хранится, картинки у неё нет
+    posts = [
+        post for post in posts
+        if getattr(post, 'image', None) and getattr(post, 'image_ready', True)
+    ]
+    keys = {post.pk: url_key(post.image.name, spec) for post in posts}
+    found = cache.get_many(list(keys.values()))
+    misses = [post for post in posts if keys[post.pk] not in found]
+    missing = {}
+    if misses and not generate:
+        stored = {}
+        if spec == CARD_THUMBNAIL:
+            stored = stored_urls([post.pk for post in misses])
+        for post in misses:
+            if post.pk in stored:
+                missing[keys[post.pk]] = stored[post.pk]
+    elif misses:
+        for post in misses:
+            missing[keys[post.pk]] = thumbnail_url(post.image, spec)
+    found.update(missing)
+    for post in posts:
+        post.thumbnail_url = found.get(keys[post.pk], '')
+    if missing:
+        cache.set_many(missing, URL_TIMEOUT)
+    return posts
+
+
+def remember(name, url, spec=CARD_THUMBNAIL):
+    cache.set(url_key(name, spec), url, URL_TIMEOUT)
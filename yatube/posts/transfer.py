@@ -0,0 +1,318 @@
+"""Массовый перенос данных: выгрузка и загрузка пользователей, групп,
+постов, комментариев и подписок.
+
+Выгрузка читает таблицы по первичному ключу через iterator(chunk_size)
+и пишет поток NDJSON (строка — объект с полем model) или каталог CSV
+(файл на модель), так что память не растёт с объёмом данных. Загрузка
+читает тот же поток построчно и вставляет объекты bulk_create пачками,
+каждая в своей транзакции. Первичные ключи сохраняются. Объект, чей id
+уже занят точно такой же записью, пропускается и попадает в отчёт:
+так загрузку можно повторить с того же файла. Если же id или
+уникальное поле заняты другими данными, загрузка останавливается —
+иначе дочерние объекты молча привязались бы к чужому пользователю,
+группе или посту. Контрольная точка (--checkpoint) позволяет
+пропустить уже вставленные пачки без повторного чтения базы.
+
+bulk_create не вызывает сигналов, поэтому после загрузки производные
+данные (счётчики, записи лент, ленты подписок, поисковый индекс)
+пересчитываются целиком, а кэш очищается.
+"""
+import csv
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+
+from . import counters, entries, feeds, search
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# порядок важен: модель идёт после тех, на кого ссылается
+MODELS = {
+    'users': (User, (
+        'id', 'username', 'password', 'first_name', 'last_name', 'email',
+        'is_active', 'is_staff', 'is_superuser', 'last_login',
+        'date_joined',
+    )),
+    'groups': (Group, ('id', 'title', 'slug', 'description')),
+    'posts': (Post, (
+        'id', 'text', 'pub_date', 'updated', 'author_id', 'group_id',
+        'image', 'image_ready',
+    )),
+    'comments': (Comment, ('id', 'post_id', 'author_id', 'text', 'created')),
+    'follows': (Follow, ('id', 'user_id', 'author_id')),
+}
+BATCH_SIZE = 2000
+LOOKUP_SIZE = 500
+
+
+def selected(names=None):
+    """Имена моделей в порядке MODELS; неизвестные — ValueError."""
+    if not names:
+        return list(MODELS)
+    unknown = set(names) - set(MODELS)
+    if unknown:
+        raise ValueError(f'Неизвестные модели: {", ".join(sorted(unknown))}')
+    return [name for name in MODELS if name in names]
+
+
+def rows(name, batch_size=BATCH_SIZE):
+    """Словари полей объектов модели name в порядке первичного ключа."""
+    model, fields = MODELS[name]
+    queryset = model.objects.order_by('pk').values_list(*fields)
+    for values in queryset.iterator(chunk_size=batch_size):
+        yield dict(zip(fields, values))
+
+
+def export_ndjson(stream, names=None, batch_size=BATCH_SIZE):
+    """Пишет объекты в stream строками NDJSON; возвращает число по
+    моделям."""
+    totals = {}
+    for name in selected(names):
+        totals[name] = 0
+        for row in rows(name, batch_size):
+            stream.write(json.dumps(
+                {'model': name, **row}, cls=DjangoJSONEncoder,
+                ensure_ascii=False
+            ) + '\n')
+            totals[name] += 1
+    return totals
+
+
+def csv_path(directory, name):
+    return os.path.join(directory, f'{name}.csv')
+
+
+def export_csv(directory, names=None, batch_size=BATCH_SIZE):
+    """Пишет по CSV-файлу на модель в directory."""
+    os.makedirs(directory, exist_ok=True)
+    totals = {}
+    for name in selected(names):
+        _, fields = MODELS[name]
+        totals[name] = 0
+        with open(csv_path(directory, name), 'w', newline='',
+                  encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for row in rows(name, batch_size):
+                writer.writerow({
+                    key: '' if value is None else value
+                    for key, value in row.items()
+                })
+                totals[name] += 1
+    return totals
+
+
+def read_ndjson(stream):
+    """(модель, словарь полей) из потока NDJSON."""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+            name = row.pop('model')
+        except (ValueError, KeyError, AttributeError):
+            raise ValueError(f'Строка {number}: ожидался объект с полем model')
+        yield name, row
+
+
+def read_csv(directory, names=None):
+    """(модель, словарь полей) из CSV-файлов каталога; пустая строка в
+    поле, допускающем NULL, — None."""
+    for name in selected(names):
+        path = csv_path(directory, name)
+        if not os.path.exists(path):
+            continue
+        nullable = {
+            field.attname for field in MODELS[name][0]._meta.concrete_fields
+            if field.null
+        }
+        with open(path, newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                yield name, {
+                    key: None if value == '' and key in nullable else value
+                    for key, value in row.items()
+                }
+
+
+class Checkpoint:
+    """Сколько объектов каждой модели уже загружено; хранится в JSON
+    и переписывается атомарно после каждой пачки."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.done = json.load(file)
+
+    def save(self, name, count):
+        self.done[name] = count
+        if not self.path:
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.done, file)
+        os.replace(temporary, self.path)
+
+
+@contextmanager
+def keep_dates():
+    """Отключает auto_now и auto_now_add: bulk_create иначе заменил бы
+    загружаемые даты текущим временем."""
+    changed = []
+    for model, _ in MODELS.values():
+        for field in model._meta.concrete_fields:
+            for flag in ('auto_now', 'auto_now_add'):
+                if getattr(field, flag, False):
+                    setattr(field, flag, False)
+                    changed.append((field, flag))
+    try:
+        yield
+    finally:
+        for field, flag in changed:
+            setattr(field, flag, True)
+
+
+def build(model, fields, row):
+    values = {}
+    for key, value in row.items():
+        field = fields.get(key)
+        if field is None:
+            raise ValueError(f'{model.__name__}: неизвестное поле {key}')
+        values[key] = field.to_python(value)
+    return model(**values)
+
+
+def same_row(*rows):
+    encoded = {json.dumps(list(row), cls=DjangoJSONEncoder) for row in rows}
+    return len(encoded) == 1
+
+
+def already_loaded(name, batch):
+    """Объекты пачки, чей id уже занят такой же записью.
+
+    Если id занят записью с другими полями — ValueError со списком id.
+    """
+    model, fields = MODELS[name]
+    ids = [obj.pk for obj in batch if obj.pk is not None]
+    stored = {}
+    # частями: у SQLite ограничено число параметров запроса
+    for start in range(0, len(ids), LOOKUP_SIZE):
+        stored.update(
+            (values[0], values)
+            for values in model.objects.filter(
+                pk__in=ids[start:start + LOOKUP_SIZE]
+            ).values_list(*fields)
+        )
+    loaded, clashes = [], []
+    for obj in batch:
+        if obj.pk not in stored:
+            continue
+        # сравнение в виде выгрузки: NDJSON хранит время до миллисекунд
+        if same_row(stored[obj.pk], [
+            model._meta.get_field(field).get_prep_value(getattr(obj, field))
+            for field in fields
+        ]):
+            loaded.append(obj)
+        else:
+            clashes.append(obj.pk)
+    if clashes:
+        raise ValueError(
+            f'{name}: id уже заняты другими данными: '
+            f'{", ".join(map(str, clashes))}'
+        )
+    return loaded
+
+
+def import_records(records, names=None, batch_size=BATCH_SIZE,
+                   checkpoint=None, stdout=None):
+    """Загружает (модель, поля) пачками; возвращает два словаря по
+    моделям: сколько объектов прочитано и сколько из них пропущено, так
+    как уже были в базе.
+
+    Объекты, уже учтённые в checkpoint, пропускаются. Пачка
+    вставляется в своей транзакции, затем сохраняется контрольная точка.
+    Конфликт id или уникального поля с другими данными — ValueError.
+    """
+    names = set(selected(names))
+    checkpoint = checkpoint or Checkpoint()
+    seen = {}
+    skipped = {}
+    batch = []
+    batch_name = None
+
+    def flush():
+        if not batch:
+            return
+        model = MODELS[batch_name][0]
+        # записи лент пересоздаёт rebuild_derived после загрузки
+        options = {'sync_entries': False} if model is Post else {}
+        with transaction.atomic():
+            loaded = {obj.pk for obj in already_loaded(batch_name, batch)}
+            new = [obj for obj in batch if obj.pk not in loaded]
+            try:
+                model.objects.bulk_create(new, **options)
+            except IntegrityError as error:
+                raise ValueError(
+                    f'{batch_name}: объекты с id {new[0].pk}–{new[-1].pk} '
+                    f'конфликтуют с данными в базе: {error}'
+                )
+        skipped[batch_name] = skipped.get(batch_name, 0) + len(loaded)
+        checkpoint.save(batch_name, seen[batch_name])
+        if stdout is not None:
+            stdout.write(f'{batch_name}: {seen[batch_name]}')
+        batch.clear()
+
+    fields_by_model = {
+        name: {
+            field.attname: field for field in model._meta.concrete_fields
+        }
+        for name, (model, _) in MODELS.items()
+    }
+    with keep_dates():
+        for name, row in records:
+            if name not in MODELS:
+                raise ValueError(f'Неизвестная модель: {name}')
+            if name not in names:
+                continue
+            position = seen.get(name, 0) + 1
+            if position > checkpoint.done.get(name, 0):
+                if name != batch_name or len(batch) >= batch_size:
+                    flush()
+                    batch_name = name
+                batch.append(
+                    build(MODELS[name][0], fields_by_model[name], row)
+                )
+            seen[name] = position
+        flush()
+    reset_sequences(names)
+    return seen, skipped
+
+
+def reset_sequences(names):
+    """Сдвигает последовательности ключей за загруженные id (на SQLite
+    ничего не делает: там ключ берётся из max(rowid))."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [MODELS[name][0] for name in names]
+    )
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def rebuild_derived(batch_size=500):
+    """Пересчитывает всё, что при обычной записи поддерживают сигналы."""
+    counters.repair_counters()
+    entries.rebuild(batch_size)
+    feeds.rebuild()
+    search.rebuild()
+    cache.clear()
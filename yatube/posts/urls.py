@@ -25,6 +25,11 @@ urlpatterns = [
         views.post_detail,
         name='post_detail'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/edit/',
         views.post_edit,
@@ -40,6 +45,11 @@ urlpatterns = [
         views.post_create,
         name='post_create'
     ),
+    path(
+        'search/',
+        views.search,
+        name='search'
+    ),
     path(
         'follow/',
         views.follow_index,
@@ -55,4 +65,9 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path(
+        'profile/<str:username>/export/',
+        views.profile_export,
+        name='profile_export'
+    ),
 ]
@@ -0,0 +1,167 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+CNT_POSTS = 10
+CNT_COMMENTS = 20
+
+OFFSET = 'offset'
+CURSOR = 'cursor'
+
+
+def encode_cursor(direction, values):
+    """Упаковывает позицию в непрозрачный токен для ?cursor=."""
+    raw = json.dumps([direction, values], separators=(',', ':'))
+    token = base64.urlsafe_b64encode(raw.encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPage:
+    """Страница курсорной пагинации без общего числа страниц."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage ({len(self)} objects)>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по уникальному набору полей сортировки.
+
+    Каждая страница — это диапазонный запрос от позиции последней
+    (или первой) записи предыдущей страницы, поэтому страница N стоит
+    столько же, сколько первая, и COUNT(*) не выполняется.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+
+    def _values(self, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def _parse(self, values):
+        if len(values) != len(self.ordering):
+            raise ValidationError('Неверная длина курсора')
+        opts = self.object_list.model._meta
+        annotations = self.object_list.query.annotations
+        return [
+            (annotations[name].output_field if name in annotations
+             else opts.get_field(name)).to_python(value)
+            for (name, _), value in zip(self.ordering, values)
+        ]
+
+    def _seek(self, values, forward):
+        """Условие «строго после позиции» в порядке сортировки."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forward else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_index in range(index):
+                prev_name = self.ordering[prev_index][0]
+                step &= Q(**{prev_name: values[prev_index]})
+            condition |= step
+        return condition
+
+    def _order_by(self, forward):
+        return [
+            f'-{name}' if descending == forward else name
+            for name, descending in self.ordering
+        ]
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor)
+        values = None
+        if position is not None:
+            try:
+                values = self._parse(position[1])
+            except (ValidationError, LookupError):
+                position = None
+        forward = position is None or position[0] == 'n'
+        queryset = self.object_list.order_by(*self._order_by(forward))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if not forward:
+            items.reverse()
+        if not items:
+            return CursorPage(items, None, None)
+        has_next = has_more if forward else True
+        has_previous = (position is not None) if forward else has_more
+        return CursorPage(
+            items,
+            encode_cursor('n', self._values(items[-1])) if has_next else None,
+            (encode_cursor('p', self._values(items[0]))
+             if has_previous else None),
+        )
+
+
+def paginate(request, object_list, view_name, per_page=CNT_POSTS,
+             ordering=None):
+    """Возвращает страницу в режиме, заданном в POSTS_PAGINATION.
+
+    ordering — уникальный порядок страниц, если он отличается от
+    Meta.ordering модели, например поля ленты из аннотаций.
+    """
+    modes = getattr(settings, 'POSTS_PAGINATION', {})
+    if ordering is None:
+        ordering = object_list.model._meta.ordering
+    if modes.get(view_name, OFFSET) == CURSOR:
+        paginator = CursorPaginator(object_list, per_page, ordering)
+        return paginator.get_page(request.GET.get('cursor'))
+    object_list = object_list.order_by(*ordering)
+    paginator = Paginator(object_list, per_page)
+    return paginator.get_page(request.GET.get('page'))
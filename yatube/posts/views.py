@@ -1,66 +1,77 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
 
-from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
+from core import ratelimit
+from core.db import retry_on_locked
 
-CNT_POSTS = 10
+from . import export, feeds, images, queries, search as post_search
+from .cache import AUTHOR, GROUP, cached_post_list
+from .conditional import (conditional, group_posts_scopes, post_detail_scopes,
+                          profile_scopes)
+from .follows import following
+from .forms import PostForm, CommentForm
+from .models import FeedEntry, Group, Post, User, Follow, UserStats
+from .thumbnails import resolve_thumbnails
+from .utils import CNT_POSTS, CursorPage, paginate
 
 
-@cache_page(20)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, CNT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = FeedEntry.objects.all()
+    page_obj, posts_html = cached_post_list(request, post_list, 'posts:index')
     context = {
         'page_obj': page_obj,
+        'post_list': posts_html,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(group_posts_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, CNT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = group.feed_entries.all()
+    page_obj, posts_html = cached_post_list(
+        request, post_list, 'posts:group_posts', (GROUP, group.pk)
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'post_list': posts_html,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(profile_scopes)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = user.posts.all()
-    paginator = Paginator(post_list, CNT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    cnt_posts_user = user.posts.count()
-    is_following = (request.user.is_authenticated
-                    and Follow.objects.filter(
-                        user=request.user,
-                        author=user
-                    ).exists())
+    user = get_object_or_404(queries.profile_author(), username=username)
+    post_list = user.feed_entries.all()
+    page_obj, posts_html = cached_post_list(
+        request, post_list, 'posts:profile', (AUTHOR, user.pk)
+    )
+    stats = UserStats.objects.for_user(user)
+    is_following = user.pk in following(request)
     context = {
         'page_obj': page_obj,
-        'cnt_posts_user': cnt_posts_user,
+        'post_list': posts_html,
+        'cnt_posts_user': stats.posts_count,
+        'stats': stats,
         'author': user,
         'following': is_following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional(post_detail_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(queries.post_detail(), pk=post_id)
+    resolve_thumbnails([post], generate=False)
     author = post.author
-    cnt_posts_user = author.posts.count()
-    comments = post.comments.all()
+    cnt_posts_user = UserStats.objects.for_user(author).posts_count
+    comments = queries.comment_page(post.pk, request.GET.get('cursor'))
     form_comment = CommentForm()
     context = {
         'post': post,
@@ -71,15 +82,59 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев: HTML-фрагмент или JSON
+    (?format=json)."""
+    comments = queries.comment_page(post_id, request.GET.get('cursor'))
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor,
+        })
+    context = {
+        'comments': comments,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    if query:
+        page_obj = post_search.search_page(
+            query,
+            queries.feed_posts(),
+            request.GET.get('cursor'),
+            CNT_POSTS
+        )
+    else:
+        page_obj = CursorPage([], None, None)
+    context = {
+        'page_obj': page_obj,
+        'search_query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@retry_on_locked
+@transaction.atomic
 def post_create(request):
     user = request.user
     if request.method == 'POST':
         form = PostForm(request.POST, files=request.FILES or None)
         if form.is_valid():
-            post = form.save(commit=False)
-            post.author = user
-            post.save()
+            images.save_post_form(form, author=user)
             url = reverse('posts:profile', args=[user.username])
             return redirect(url)
     else:
@@ -88,6 +143,8 @@ def post_create(request):
 
 
 @login_required
+@retry_on_locked
+@transaction.atomic
 def post_edit(request, post_id):
     user = request.user
     post = get_object_or_404(Post, id=post_id)
@@ -101,7 +158,7 @@ def post_edit(request, post_id):
             instance=post
         )
         if form.is_valid():
-            form.save()
+            images.save_post_form(form)
             return redirect('posts:post_detail', post_id=post.pk)
     else:
         form = PostForm(instance=post)
@@ -110,6 +167,8 @@ def post_edit(request, post_id):
 
 
 @login_required
+@retry_on_locked
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -123,10 +182,9 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, CNT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = queries.feed_posts(feeds.follow_feed(request.user))
+    page_obj = paginate(request, post_list, 'posts:follow_index',
+                        ordering=feeds.FOLLOW_FEED_ORDERING)
     context = {
         'page_obj': page_obj,
     }
@@ -134,6 +192,8 @@ def follow_index(request):
 
 
 @login_required
+@retry_on_locked
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -143,8 +203,44 @@ def profile_follow(request, username):
 
 
 @login_required
+@retry_on_locked
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
     url = reverse('posts:profile', args=[username])
     return redirect(url)
+
+
+@login_required
+def profile_export(request, username):
+    """История пользователя файлом: NDJSON или CSV (?format=csv),
+    ?gzip=1 — со сжатием. Выгружать можно только свою историю."""
+    user = request.user
+    if user.username != username:
+        return redirect('posts:profile', username=username)
+    data_format = request.GET.get('format', 'ndjson')
+    if data_format not in export.FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат выгрузки')
+    limit, window = getattr(settings, 'POSTS_EXPORT_RATE_LIMIT', (5, 3600))
+    wait = ratelimit.retry_after('profile_export', user.pk, limit, window)
+    if wait:
+        response = HttpResponse(
+            'Слишком много выгрузок, попробуйте позже', status=429,
+            content_type='text/plain; charset=utf-8'
+        )
+        response['Retry-After'] = wait
+        return response
+    compress = request.GET.get('gzip') == '1'
+    filename = f'{username}-history.{data_format}'
+    if compress:
+        content_type = 'application/gzip'
+        filename += '.gz'
+    else:
+        content_type = f'{export.FORMATS[data_format]}; charset=utf-8'
+    response = StreamingHttpResponse(
+        export.stream(user, data_format, compress),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import PasswordChangeForm, UserCreationForm
+from django.contrib.auth.forms import (PasswordChangeForm,
+                                       PasswordResetForm, UserCreationForm)
+from django.contrib.sites.shortcuts import get_current_site
+
+from .tasks import send_password_reset
 
 User = get_user_model()
 
@@ -14,3 +18,13 @@ class ChangePassword(PasswordChangeForm):
     class Meta:
         model = User
         fields = ('old_password', 'new_password1', 'new_password2')
+
+
+class PasswordReset(PasswordResetForm):
+    """Письмо сброса пароля отправляет фоновая задача."""
+
+    def save(self, domain_override=None, use_https=False, request=None,
+             **kwargs):
+        domain = domain_override or get_current_site(request).domain
+        for user in self.get_users(self.cleaned_data['email']):
+            send_password_reset.delay(user.pk, domain, use_https)
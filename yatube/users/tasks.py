@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core.tasks import task
+
+User = get_user_model()
+
+# шаблоны письма те же, что у PasswordResetView по умолчанию
+RESET_SUBJECT_TEMPLATE = 'registration/password_reset_subject.txt'
+RESET_EMAIL_TEMPLATE = 'registration/password_reset_email.html'
+
+
+@task(priority=20)
+def send_password_reset(user_id, domain, use_https):
+    """Отправляет письмо со ссылкой сброса пароля.
+
+    Токен создаётся и письмо собирается здесь: в очереди лежат только
+    id пользователя и адрес сайта, а не действующая ссылка сброса.
+    """
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.has_usable_password() or not user.email:
+        return
+    context = {
+        'email': user.email,
+        'domain': domain,
+        'site_name': domain,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'user': user,
+        'token': default_token_generator.make_token(user),
+        'protocol': 'https' if use_https else 'http',
+    }
+    subject = loader.render_to_string(RESET_SUBJECT_TEMPLATE, context)
+    body = loader.render_to_string(RESET_EMAIL_TEMPLATE, context)
+    EmailMultiAlternatives(
+        ''.join(subject.splitlines()), body, None, [user.email]
+    ).send()
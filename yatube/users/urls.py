@@ -9,6 +9,7 @@ from django.contrib.auth.views import (LoginView,
 from django.urls import path
 
 from . import views
+from .forms import PasswordReset
 
 
 app_name = 'users'
@@ -48,7 +49,8 @@ urlpatterns = [
     path(
         'password_reset/',
         PasswordResetView.as_view(
-            template_name='users/password_reset_form.html'
+            template_name='users/password_reset_form.html',
+            form_class=PasswordReset
         ),
         name='password_reset_form'
     ),
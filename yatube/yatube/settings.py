@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.auth',
     'django.contrib.admin',
     'django.contrib.contenttypes',
@@ -54,11 +55,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.routers.ReplicaMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -76,7 +80,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -99,11 +103,55 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite с WAL, PRAGMA и BEGIN IMMEDIATE (core/db_backends)
+        'ENGINE': 'core.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение живёт между запросами и проверяется перед первым
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            # дополняют и переопределяют PRAGMAS бэкенда
+            'pragmas': {},
+        },
     }
 }
 
+# сколько раз и с какой начальной паузой повторять запись,
+# не дождавшуюся блокировки SQLite (core.db.retry_on_locked)
+DB_LOCK_RETRIES = 3
+DB_LOCK_RETRY_DELAY = 0.05
+
+# реплика для чтения: копия базы, которую поддерживает внешняя
+# репликация (например, Litestream); без неё всё читается из default
+REPLICA_DB = os.environ.get('YATUBE_REPLICA_DB')
+if REPLICA_DB:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': REPLICA_DB,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = ['replica'] if REPLICA_DB else []
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# столько секунд после записи браузер читает только из default;
+# должно быть больше отставания реплики
+REPLICA_LAG_SECONDS = 5
+# GET-страницы, которые можно читать с реплики
+REPLICA_READ_VIEWS = [
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+    'about:author',
+    'about:tech',
+]
+# записи через GET, после которых тоже нужно читать из default
+REPLICA_PIN_VIEWS = [
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -162,8 +210,70 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# очередь фоновых задач (core.tasks, выполняет manage.py run_tasks):
+# пауза перед первым повтором упавшей задачи, дальше она удваивается
+TASKS_RETRY_DELAY = 10
+TASKS_RETRY_MAX_DELAY = 60 * 60
+# задача, взятая дольше этого, считается брошенной и возвращается в очередь
+TASKS_LOCK_TIMEOUT = 60 * 10
+# True — выполнять задачи сразу после коммита, без воркера
+TASKS_EAGER = False
+
+# режим пагинации лент: 'offset' (номера страниц) или 'cursor'
+# (ссылки «вперёд/назад» по ?cursor= без COUNT(*) и OFFSET)
+POSTS_PAGINATION = {
+    'posts:index': 'offset',
+    'posts:group_posts': 'offset',
+    'posts:profile': 'offset',
+    'posts:follow_index': 'cursor',
+}
+
+# посты авторов с таким числом подписчиков не раскладываются по лентам
+# подписок при записи, а подмешиваются при чтении
+FOLLOW_FEED_FANOUT_LIMIT = 1000
+
+# время жизни кэша лент в кэше, общем для всех процессов (Memcached,
+# Redis): устаревшие записи вытесняются сменой версий при записи
+# постов, комментариев и подписок, так что TTL нужен лишь для
+# освобождения памяти
+POSTS_CACHE_TIMEOUT = 60 * 60 * 6
+# то же для кэша в памяти процесса (LocMemCache): версии, поднятые
+# другими воркерами, до него не доходят, поэтому записи и версии живут
+# коротко — это предел устаревания страниц при нескольких воркерах
+POSTS_LOCAL_CACHE_TIMEOUT = 60
+
+# обработка загруженных картинок постов фоновой задачей:
+# ограничение оригинала по размеру и заранее созданные миниатюры
+POSTS_IMAGE_MAX_SIZE = (1920, 1920)
+# сколько картинок обрабатывается одновременно всеми воркерами
+POSTS_IMAGE_WORKERS = 2
+# True — обрабатывать сразу после коммита в том же потоке
+POSTS_IMAGE_EAGER = False
+
+# длина текста поста в карточках лент index, group и profile (FeedEntry)
+POSTS_FEED_TEXT_LENGTH = 1000
+
+# выгрузок истории (posts:profile_export) на пользователя за окно в секундах
+POSTS_EXPORT_RATE_LIMIT = (5, 60 * 60)
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.LocMemCache',
     }
 }
+
+# метрики запросов (core.metrics): запросы дольше этого порога пишутся
+# в лог вместе с SQL, но не больше METRICS_SQL_LIMIT выражений
+METRICS_SLOW_REQUEST_SECONDS = 1.0
+METRICS_SQL_LIMIT = 50
+# /metrics/ отдаётся персоналу и по заголовку
+# Authorization: Bearer <токен>; без токена — только персоналу
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN')
+
+# семплирующий профайлер (core.profiling): стеки профилированных запросов
+# пишутся сюда; доля случайно профилируемых запросов (0 — только по
+# заголовку X-Profile и ?profile=1 для персонала) и шаг семплирования
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.defaults import permission_denied
 
+from core.views import metrics
+
 handler404 = 'core.views.page_not_found'
 handler403 = permission_denied
 
@@ -28,7 +30,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('about/', include('about.urls', namespace='about')),
     path('auth/', include('users.urls', namespace='users')),
-    path('auth/', include('django.contrib.auth.urls'))
+    path('auth/', include('django.contrib.auth.urls')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path('metrics/', metrics, name='metrics'),
 ]
 
 if settings.DEBUG: